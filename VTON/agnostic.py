@@ -0,0 +1,220 @@
+import numpy as np
+import torch
+from PIL import Image
+
+
+# shapes are rasterized by testing pixel centres against per-sample shape
+# parameters, so a whole batch is drawn at once. Each shape only evaluates the
+# union of its bounding boxes over the batch and returns that (B, h, w) boolean
+# patch together with its location in the image.
+
+def region(x0, y0, x1, y1, h, w):
+    # clipped union bounding box of per-sample boxes -> (row slice, column slice)
+    x0 = min(max(int(np.floor(x0.min().item())), 0), w)
+    y0 = min(max(int(np.floor(y0.min().item())), 0), h)
+    x1 = max(min(int(np.ceil(x1.max().item())) + 1, w), x0)
+    y1 = max(min(int(np.ceil(y1.max().item())) + 1, h), y0)
+    return slice(y0, y1), slice(x0, x1)
+
+
+def pixel_grid(box, device=None):
+    rows, cols = box
+    ys = torch.arange(rows.start, rows.stop, dtype=torch.float32, device=device).view(1, -1, 1)
+    xs = torch.arange(cols.start, cols.stop, dtype=torch.float32, device=device).view(1, 1, -1)
+    return xs, ys
+
+
+def ellipse(size, center, rx, ry):
+    # center: (B, 2), rx / ry: (B,) semi-axes
+    cx, cy = center[:, 0], center[:, 1]
+    box = region(cx - rx, cy - ry, cx + rx, cy + ry, *size)
+    xs, ys = pixel_grid(box, center.device)
+    dx = (xs - cx[:, None, None]) / rx[:, None, None]
+    dy = (ys - cy[:, None, None]) / ry[:, None, None]
+    return dx * dx + dy * dy <= 1, box
+
+
+def rectangle(size, x0, y0, x1, y1):
+    box = region(x0, y0, x1, y1, *size)
+    xs, ys = pixel_grid(box, x0.device)
+    return ((xs >= x0[:, None, None]) & (xs <= x1[:, None, None]) &
+            (ys >= y0[:, None, None]) & (ys <= y1[:, None, None])), box
+
+
+def thick_line(size, a, b, width):
+    # segment a -> b of the given width without end caps, like ImageDraw.line
+    half = width / 2
+    box = region(torch.min(a[:, 0], b[:, 0]) - half, torch.min(a[:, 1], b[:, 1]) - half,
+                 torch.max(a[:, 0], b[:, 0]) + half, torch.max(a[:, 1], b[:, 1]) + half, *size)
+    xs, ys = pixel_grid(box, a.device)
+    d = b - a
+    length = d.norm(dim=1).clamp(min=1e-6)
+    ux = (d[:, 0] / length)[:, None, None]
+    uy = (d[:, 1] / length)[:, None, None]
+    px = xs - a[:, 0, None, None]
+    py = ys - a[:, 1, None, None]
+    along = px * ux + py * uy
+    across = px * uy - py * ux
+    return (along >= 0) & (along <= length[:, None, None]) & (across.abs() <= half[:, None, None]), box
+
+
+def polygon(size, points):
+    # points: (B, K, 2), even-odd fill
+    box = region(points[..., 0].min(dim=1)[0], points[..., 1].min(dim=1)[0],
+                 points[..., 0].max(dim=1)[0], points[..., 1].max(dim=1)[0], *size)
+    xs, ys = pixel_grid(box, points.device)
+    inside = torch.zeros(points.size(0), ys.size(1), xs.size(2), dtype=torch.bool, device=points.device)
+    k = points.size(1)
+    for i in range(k):
+        x0, y0 = points[:, i, 0, None, None], points[:, i, 1, None, None]
+        x1, y1 = points[:, (i + 1) % k, 0, None, None], points[:, (i + 1) % k, 1, None, None]
+        crosses = (y0 > ys) != (y1 > ys)
+        x_cross = x0 + (ys - y0) * (x1 - x0) / torch.where(y1 == y0, torch.ones_like(y1), y1 - y0)
+        inside ^= crosses & (xs < x_cross)
+    return inside, box
+
+
+def paint(mask, shape, valid=None):
+    # ORs a shape patch into the (B, H, W) mask, only for samples where `valid` is set
+    patch, (rows, cols) = shape
+    if valid is not None:
+        patch = patch & valid[:, None, None]
+    mask[:, rows, cols] |= patch
+
+
+# head and lower body labels, always taken from the person image
+KEEP_LABELS = torch.zeros(256, dtype=torch.bool)
+KEEP_LABELS[[4, 13, 9, 12, 16, 17, 18, 19]] = True
+
+# upper clothes and neck, always cleared from the parse-agnostic map
+CLEAR_LABELS = torch.zeros(256, dtype=torch.bool)
+CLEAR_LABELS[[5, 6, 7, 10]] = True
+
+
+def is_valid(pose, i):
+    # openpose writes (0, 0) for undetected joints
+    return (pose[:, i] != 0).any(dim=1)
+
+
+def agnostic_masks(pose, h, w):
+    """
+        Rasterizes the gray cloth-agnostic region for a batch of (B, 25, 2)
+        keypoint tensors. Returns the (B, H, W) gray mask and the (B, 2, H, W)
+        masks of the left / right arm region that stays gray.
+    """
+    pose = pose.clone().float()
+    size = (h, w)
+
+    # stretch the hips to shoulder width
+    length_a = (pose[:, 5] - pose[:, 2]).norm(dim=1)
+    length_b = (pose[:, 12] - pose[:, 9]).norm(dim=1)
+    point = (pose[:, 9] + pose[:, 12]) / 2
+    pose[:, 9] = point + (pose[:, 9] - point) / length_b[:, None] * length_a[:, None]
+    pose[:, 12] = point + (pose[:, 12] - point) / length_b[:, None] * length_a[:, None]
+
+    r = (length_a / 16).floor() + 1
+
+    # mask torso
+    gray = torch.zeros(pose.size(0), h, w, dtype=torch.bool, device=pose.device)
+    for i in [9, 12]:
+        paint(gray, ellipse(size, pose[:, i], r * 3, r * 6))
+    paint(gray, thick_line(size, pose[:, 2], pose[:, 9], r * 6))
+    paint(gray, thick_line(size, pose[:, 5], pose[:, 12], r * 6))
+    paint(gray, thick_line(size, pose[:, 9], pose[:, 12], r * 12))
+    paint(gray, polygon(size, pose[:, [2, 5, 12, 9]]))
+
+    # mask neck
+    neck = pose[:, 1]
+    paint(gray, rectangle(size, neck[:, 0] - r * 5, neck[:, 1] - r * 9, neck[:, 0] + r * 5, neck[:, 1]))
+
+    # mask arms
+    paint(gray, thick_line(size, pose[:, 2], pose[:, 5], r * 12))
+    for i in [2, 5]:
+        paint(gray, ellipse(size, pose[:, i], r * 5, r * 6))
+    for i in [3, 4, 6, 7]:
+        valid = is_valid(pose, i - 1) & is_valid(pose, i)
+        paint(gray, thick_line(size, pose[:, i - 1], pose[:, i], r * 10), valid)
+        paint(gray, ellipse(size, pose[:, i], r * 5, r * 5), valid)
+
+    arms = torch.zeros(pose.size(0), 2, h, w, dtype=torch.bool, device=pose.device)
+    for k, pose_ids in enumerate([[5, 6, 7], [2, 3, 4]]):
+        arm = arms[:, k]
+        paint(arm, ellipse(size, pose[:, pose_ids[0]], r * 5, r * 6))
+        end = pose[:, pose_ids[0]]
+        for i in pose_ids[1:]:
+            valid = is_valid(pose, i - 1) & is_valid(pose, i)
+            paint(arm, thick_line(size, pose[:, i - 1], pose[:, i], r * 10), valid)
+            if i != pose_ids[-1]:
+                paint(arm, ellipse(size, pose[:, i], r * 5, r * 5), valid)
+            end = torch.where(valid[:, None], pose[:, i], end)
+        paint(arm, ellipse(size, end, r * 4, r * 4))
+    return gray, arms
+
+
+def get_agnostic_batch(images, parses, poses):
+    """
+        Batched cloth-agnostic person images.
+
+        images: (B, H, W, 3) uint8, parses: (B, H, W) image-parse-v3 labels,
+        poses: (B, 25, 2) keypoints, all full-size tensors on the same device.
+        Returns (B, H, W, 3) uint8 images with the torso, neck and upper arms
+        grayed out and the head, lower body and hands kept from the input.
+    """
+    h, w = parses.shape[1:]
+    gray, arms = agnostic_masks(poses, h, w)
+    parses = parses.long()
+
+    # arm pixels outside the drawn arm region, head and lower body are kept
+    gray &= ~KEEP_LABELS.to(parses.device)[parses]
+    gray &= ~((parses == 14) & ~arms[:, 0])
+    gray &= ~((parses == 15) & ~arms[:, 1])
+    return images.masked_fill(gray[..., None], 128)
+
+
+def parse_agnostic_masks(pose, h, w, r=10):
+    """
+        Rasterizes the arm regions cleared by get_im_parse_agnostic for a batch
+        of (B, 25, 2) keypoints. Returns the (B, 2, H, W) left / right arm masks.
+    """
+    pose = pose.float()
+    size = (h, w)
+    r = torch.full((pose.size(0),), float(r), device=pose.device)
+
+    arms = torch.zeros(pose.size(0), 2, h, w, dtype=torch.bool, device=pose.device)
+    for k, pose_ids in enumerate([[2, 5, 6, 7], [5, 2, 3, 4]]):
+        # joints that are not detected are skipped and the segment restarts from the last drawn one
+        prev = pose[:, pose_ids[0]]
+        prev_valid = is_valid(pose, pose_ids[0])
+        for i in pose_ids[1:]:
+            valid = prev_valid & is_valid(pose, i)
+            radius = r * 4 if i == pose_ids[-1] else r * 15
+            paint(arms[:, k], thick_line(size, prev, pose[:, i], r * 10), valid)
+            paint(arms[:, k], ellipse(size, pose[:, i], radius, radius), valid)
+            prev = torch.where(valid[:, None], pose[:, i], prev)
+            prev_valid = prev_valid | valid
+    return arms
+
+
+def get_parse_agnostic_batch(parses, poses):
+    """
+        Batched counterpart of get_parse_agnostic.get_im_parse_agnostic.
+
+        parses: (B, H, W) uint8 image-parse-v3 labels, poses: (B, 25, 2) keypoints.
+        Returns the parses with the upper clothes, the neck and the arms inside
+        the drawn arm region set to background.
+    """
+    h, w = parses.shape[1:]
+    arms = parse_agnostic_masks(poses, h, w)
+    labels = parses.long()
+    clear = CLEAR_LABELS.to(parses.device)[labels]
+    clear |= (labels == 14) & arms[:, 0]
+    clear |= (labels == 15) & arms[:, 1]
+    return parses.masked_fill(clear, 0)
+
+
+def get_agnostic(im, im_parse, pose_data):
+    # single-sample PIL wrapper around get_agnostic_batch
+    images = torch.from_numpy(np.array(im.convert('RGB')))[None]
+    parses = torch.from_numpy(np.array(im_parse))[None]
+    poses = torch.from_numpy(np.asarray(pose_data, dtype=np.float32))[None]
+    return Image.fromarray(get_agnostic_batch(images, parses, poses)[0].numpy())
@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from torch.utils.data.dataloader import default_collate
+
+from utils import tensor_to_image
+
+
+class BatchScheduler(object):
+    """
+        Micro-batching front end for a TryOnEngine.
+
+        Requests are preprocessed on the caller's thread and queued; a single worker
+        thread collects up to `max_batch_size` pending samples, waiting at most
+        `max_wait_ms` after the first one arrives, runs them as one batch through
+        the condition generator and the SPADE generator and scatters the outputs
+        back to the callers' futures.
+    """
+    def __init__(self, engine, max_batch_size=4, max_wait_ms=10):
+        super(BatchScheduler, self).__init__()
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.num_requests = 0
+        self.num_batches = 0
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, sample):
+        # sample: an uncollated engine input, returns a Future of the (3, H, W) output tensor
+        future = Future()
+        self.queue.put((sample, future))
+        return future
+
+    def tryon(self, person, cloth, pattern=None):
+        key = self.engine.result_key(person, cloth, pattern)
+        output = self.engine.cached_output(key)
+        if output is None:
+            output = self.submit(self.engine.prepare(person, cloth, pattern)).result()
+            self.engine.store_output(key, output)
+        return tensor_to_image(output)
+
+    def cached_tryon(self, person, cloth, pattern=None):
+        # the full-resolution result from the engine's result cache, None on a miss
+        output = self.engine.cached_output(self.engine.result_key(person, cloth, pattern))
+        return None if output is None else tensor_to_image(output)
+
+    def tryon_progressive(self, person, cloth, pattern=None, sizes=None):
+        # previews (the engine's preview_sizes by default) are rendered by the engine on the caller's thread,
+        # the full-resolution pass is batched and stored in the engine's result cache (see cached_tryon)
+        sample = self.engine.prepare(person, cloth, pattern)
+        for output in self.engine.render(sample, self.engine.preview_sizes if sizes is None else sizes):
+            yield tensor_to_image(output)
+        output = self.submit(sample).result()
+        self.engine.store_output(self.engine.result_key(person, cloth, pattern), output)
+        yield tensor_to_image(output)
+
+    def tryon_arrays(self, person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic=None):
+        sample = self.engine.prepare_arrays(person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic)
+        return self.submit(sample).result()
+
+    def collect(self):
+        # blocks for the first request, then drains the queue until the batch is full or the wait expires
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            if batch is None:
+                break
+            futures = [future for _, future in batch]
+            try:
+                outputs = self.engine.forward(default_collate([sample for sample, _ in batch]))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            outputs = outputs.cpu()
+            for i, future in enumerate(futures):
+                future.set_result(outputs[i])
+            self.num_requests += len(batch)
+            self.num_batches += 1
+
+    def mean_batch_size(self):
+        return self.num_requests / max(self.num_batches, 1)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
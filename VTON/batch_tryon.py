@@ -0,0 +1,240 @@
+import argparse
+import collections
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import os.path as osp
+import sys
+import threading
+import time
+
+from torch.utils.data.dataloader import default_collate
+
+from inference_engine import TryOnEngine
+from output_writer import OutputWriter, save_output
+from pair_scheduler import GROUP_BY, group_pairs, shard_pairs, schedule_report
+from test_generator import get_opt, output_name
+
+
+MANIFEST_NAME = 'manifest_%d.jsonl'
+
+
+def read_shard(path, rank, num_shards):
+    # lazily yields the (person, cloth) pairs on lines rank, rank + num_shards, ... of a pair list
+    with open(path, 'r') as f:
+        for i, line in enumerate(f):
+            if i % num_shards == rank and line.strip():
+                im_name, c_name = line.split()
+                yield im_name, c_name
+
+
+def batches(pairs, batch_size):
+    pairs = iter(pairs)
+    while True:
+        batch = list(itertools.islice(pairs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class Manifest(object):
+    """
+        Append-only JSON-lines log of one shard: one record per pair with its
+        output path and per-image load / inference times, or the error that
+        stopped it. Records are appended by the writer threads once the output
+        is on disk, so the log never lists a file that was not written.
+    """
+    def __init__(self, path):
+        super(Manifest, self).__init__()
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def save_result(output, path, output_format, manifest, record):
+    record['output'] = save_output(output, path, output_format)
+    manifest.write(record)
+
+
+def run_shard(rank, num_shards, pairs_path, argv, sched):
+    """
+        Renders shard `rank` of `pairs_path` with its own model replica: every
+        `num_shards`-th line, or every `num_shards`-th group of the pair
+        scheduler. Person and garment features go through the TryOnEngine
+        caches, so grouped pairs decode and encode each side once per group.
+        Pairs whose output already exists are skipped, so a crashed or
+        interrupted run is resumed by starting it again. With a result cache,
+        pairs rendered before by any run with the same models and options are
+        copied from it instead of being rendered again.
+    """
+    opt = get_opt(argv)
+    if opt.num_threads == 0:
+        opt.num_threads = max(1, (os.cpu_count() or 1) // num_shards)
+    engine = TryOnEngine(opt, person_cache_size=sched.person_cache_size, garment_cache_size=sched.garment_cache_size,
+                         result_cache_dir=sched.result_cache_dir, result_cache_bytes=int(sched.result_cache_gb * 2**30),
+                         calib_path=pairs_path)
+    if sched.group_by == 'none':
+        pairs = read_shard(pairs_path, rank, num_shards)
+    else:
+        pairs = shard_pairs(group_pairs(read_shard(pairs_path, 0, 1), sched.group_by), rank, num_shards)
+
+    stats = collections.Counter()
+
+    def pending(pairs):
+        for im_name, c_name in pairs:
+            if osp.exists(osp.join(opt.output_dir, output_name(im_name, c_name)) + '.' + opt.output_format):
+                stats['skipped'] += 1
+            else:
+                yield im_name, c_name
+
+    manifest = Manifest(osp.join(opt.output_dir, MANIFEST_NAME % rank))
+
+    def fail(pairs, e):
+        # logged and left without an output, so the next run retries them
+        for im_name, c_name in pairs:
+            manifest.write({'person': im_name, 'cloth': c_name, 'shard': rank, 'error': '%s: %s' % (type(e).__name__, e)})
+        stats['failed'] += len(pairs)
+
+    with OutputWriter(opt.writer_workers, opt.writer_queue) as writer:
+        for batch in batches(pending(pairs), opt.batch_size):
+            start = time.perf_counter()
+            samples, keys = [], []
+            for pair in list(batch):
+                lookup_start = time.perf_counter()
+                try:
+                    key = engine.result_key(*pair)
+                    output = engine.cached_output(key)
+                    if output is None:
+                        samples.append(engine.prepare(*pair))
+                        keys.append(key)
+                        continue
+                except Exception as e:
+                    # a missing file or an undetected person only drops its own pair
+                    fail([pair], e)
+                    batch.remove(pair)
+                    continue
+                batch.remove(pair)
+                record = {'person': pair[0], 'cloth': pair[1], 'shard': rank, 'cached': True,
+                          'load_ms': round((time.perf_counter() - lookup_start) * 1000, 1), 'infer_ms': 0.0}
+                writer.submit(save_result, output, osp.join(opt.output_dir, output_name(*pair)), opt.output_format, manifest, record)
+                stats['cached'] += 1
+            if not batch:
+                continue
+            load_time = time.perf_counter() - start
+            try:
+                output = engine.forward(default_collate(samples)).cpu()
+            except Exception as e:
+                fail(batch, e)
+                continue
+            infer_time = time.perf_counter() - start - load_time
+
+            for i, (im_name, c_name) in enumerate(batch):
+                record = {'person': im_name, 'cloth': c_name, 'shard': rank,
+                          'load_ms': round(load_time * 1000 / len(batch), 1),
+                          'infer_ms': round(infer_time * 1000 / len(batch), 1)}
+                writer.submit(save_result, output[i], osp.join(opt.output_dir, output_name(im_name, c_name)),
+                              opt.output_format, manifest, record)
+                writer.submit(engine.store_output, keys[i], output[i])
+            stats['rendered'] += len(batch)
+            print("shard %d: %d rendered" % (rank, stats['rendered']))
+    manifest.close()
+    print("shard %d done: %d rendered, %d from the result cache, %d skipped, %d failed" % (
+        rank, stats['rendered'], stats['cached'], stats['skipped'], stats['failed']))
+    for side, cache in [('person', engine.person_cache), ('garment', engine.garment_cache)]:
+        loads = cache.misses + cache.disk_hits
+        print("shard %d %s: %d decodes / encoder passes for %d lookups, %d saved" % (rank, side, loads, loads + cache.hits, cache.hits))
+    if engine.result_cache is not None:
+        cache_stats = engine.result_cache.stats()
+        print("shard %d result cache: %d hits (%.1f ms), %d misses (%.1f ms), %d evictions, %.0f MB" % (
+            rank, cache_stats['hits'], cache_stats['hit_ms'], cache_stats['misses'], cache_stats['miss_ms'],
+            cache_stats['evictions'], cache_stats['bytes'] / 2**20))
+
+
+def summarize(output_dir):
+    # totals over the manifests of every shard and every run so far
+    records = []
+    for path in sorted(glob.glob(osp.join(output_dir, MANIFEST_NAME.replace('%d', '*')))):
+        with open(path, 'r') as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    # the last record of a pair wins, a pair rendered again after its output was deleted counts once
+    done = list({(r['person'], r['cloth']): r for r in records if 'error' not in r}.values())
+    failed = {(r['person'], r['cloth']) for r in records if 'error' in r} - {(r['person'], r['cloth']) for r in done}
+    print("%d outputs in %s (%d from the result cache), %d pairs failing" % (
+        len(done), output_dir, sum(1 for r in done if r.get('cached')), len(failed)))
+    if done:
+        print("mean load %.1f ms/image, mean inference %.1f ms/image" % (
+            sum(r['load_ms'] for r in done) / len(done), sum(r['infer_ms'] for r in done) / len(done)))
+
+
+def main():
+    """
+        Renders a large pair list into --output_dir, sharded over --num_procs
+        worker processes that each load their own copy of the networks and split
+        the cores between them, e.g.
+            python batch_tryon.py --pairs catalogue_pairs.txt --num_procs 4 --cpu_fast \\
+                --tocg_checkpoint ... --gen_checkpoint ... --output_dir ./catalogue --output_format webp
+        The list holds one "person cloth" pair per line; --pairs defaults to
+        --dataroot/--data_list. By default the pairs of one person or one cloth
+        are rendered back to back (see pair_scheduler.py), --group_by none
+        streams the list in file order instead. Rerunning the same command
+        resumes an interrupted run. --result_cache_dir keeps every output by
+        content (see result_cache.py), so later runs over overlapping pair lists,
+        with the same checkpoints and options, copy the pairs rendered before
+        instead of running the networks. Each shard appends its timings to
+        manifest_<shard>.jsonl in the output directory. Every other flag is passed
+        to test_generator.get_opt.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=str, default=None, help='pair list, defaults to --dataroot/--data_list')
+    parser.add_argument('--num_procs', type=int, default=1, help='worker processes, one model replica each')
+    parser.add_argument('--group_by', choices=GROUP_BY, default='auto', help='render the pairs of one person / cloth consecutively, none keeps the file order')
+    parser.add_argument('--person_cache_size', type=int, default=16, help='person features kept per worker')
+    parser.add_argument('--garment_cache_size', type=int, default=64, help='garment features kept per worker')
+    parser.add_argument('--result_cache_dir', type=str, default=None, help='content-addressed store of rendered outputs, shared by the workers')
+    parser.add_argument('--result_cache_gb', type=float, default=2, help='size of the result cache before the least recently used outputs are deleted')
+    args, rest = parser.parse_known_args()
+    opt = get_opt(rest)
+    pairs_path = args.pairs or osp.join(opt.dataroot, opt.data_list)
+    os.makedirs(opt.output_dir, exist_ok=True)
+
+    if args.group_by != 'none':
+        report = schedule_report(read_shard(pairs_path, 0, 1), args.group_by, args.num_procs,
+                                 args.person_cache_size, args.garment_cache_size)
+        print("%d pairs grouped by %s" % (report['pairs'], report['group_by']))
+        for side in ['person', 'cloth']:
+            file_order, grouped = report[side]
+            print("%-6s decodes / encoder passes: %d in file order, %d grouped, %d saved" % (side, file_order, grouped, file_order - grouped))
+
+    start = time.time()
+    if args.num_procs == 1:
+        run_shard(0, 1, pairs_path, rest, args)
+        exit_codes = [0]
+    else:
+        # spawned rather than forked, so every worker starts its own torch thread pool
+        context = multiprocessing.get_context('spawn')
+        procs = [context.Process(target=run_shard, args=(rank, args.num_procs, pairs_path, rest, args))
+                 for rank in range(args.num_procs)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        exit_codes = [proc.exitcode for proc in procs]
+    print("Batch time %.1f s" % (time.time() - start))
+    summarize(opt.output_dir)
+
+    if any(exit_codes):
+        print("shards %s exited with an error, rerun to resume" % [rank for rank, code in enumerate(exit_codes) if code])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import copy
+import sys
+import time
+
+import torch
+
+from network_generator import SPADEResBlock
+from networks import GaussianBlur, cache_stats
+from test_generator import get_opt, build_models, prepare_inference, run_tryon
+
+
+def make_batch(opt, batch_size):
+    # random inputs with the shapes of a collated CPDatasetTest batch
+    h, w = opt.fine_height, opt.fine_width
+    parse_agnostic = torch.zeros(batch_size, opt.semantic_nc, h, w)
+    parse_agnostic[:, 0] = 1
+    return {
+        'cloth': {opt.datasetting: torch.rand(batch_size, 3, h, w) * 2 - 1},
+        'cloth_mask': {opt.datasetting: (torch.rand(batch_size, 1, h, w) > 0.5).float()},
+        'parse_agnostic': parse_agnostic,
+        'densepose': torch.rand(batch_size, 3, h, w) * 2 - 1,
+        'agnostic': torch.rand(batch_size, 3, h, w) * 2 - 1,
+        }
+
+
+def benchmark(opt, inputs, tocg, generator, gauss, iters):
+    # returns (ms per image, output of the first timed run, grid / blur cache counts of the timed runs)
+    with torch.inference_mode():
+        run_tryon(opt, inputs, tocg, generator, gauss)  # warm-up, traces / compiles on first call
+        torch.manual_seed(0)
+        stats = cache_stats.copy()
+        start = time.perf_counter()
+        output = run_tryon(opt, inputs, tocg, generator, gauss)['output']
+        for _ in range(iters - 1):
+            run_tryon(opt, inputs, tocg, generator, gauss)
+        elapsed = time.perf_counter() - start
+    return elapsed * 1000 / (iters * inputs['agnostic'].size(0)), output, cache_stats - stats
+
+
+class BlockTimer(object):
+    """
+        Wall time of every SPADEResBlock of an eager generator, and the part of
+        it spent in the SPADE modulation (SPADENorm.modulation), accumulated over
+        the forwards run inside the `with` block. The label pyramid of
+        --seg_pyramid is timed on its own.
+    """
+    def __init__(self, generator):
+        super(BlockTimer, self).__init__()
+        self.generator = generator
+        self.times = {}
+        self.sizes = {}
+        self.handles = []
+        self.wrapped = []
+
+    def clock(self, tensor):
+        if tensor.is_cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def add(self, key, elapsed):
+        self.times[key] = self.times.get(key, 0) + elapsed
+
+    def wrap(self, module, name, key):
+        # times the method `name` of one module instance
+        method = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            self.add(key, self.clock(args[0]) - start)
+            return result
+        setattr(module, name, timed)
+        self.wrapped.append((module, name))
+
+    def __enter__(self):
+        starts = {}
+        for name, module in self.generator.named_children():
+            if not isinstance(module, SPADEResBlock):
+                continue
+
+            def pre_hook(module, inputs, name=name):
+                starts[name] = self.clock(inputs[0])
+
+            def hook(module, inputs, output, name=name):
+                self.add((name, 'total'), self.clock(output) - starts[name])
+                self.sizes[name] = tuple(output.shape[2:])
+            self.handles += [module.register_forward_pre_hook(pre_hook), module.register_forward_hook(hook)]
+            for _, norm in module.norms():
+                self.wrap(norm, 'modulation', (name, 'modulation'))
+        self.wrap(self.generator, 'label_pyramid', ('pyramid', 'total'))
+
+        def pre_hook(module, inputs):
+            starts['generator'] = self.clock(inputs[0])
+
+        def hook(module, inputs, output):
+            self.add(('generator', 'total'), self.clock(output) - starts['generator'])
+        self.handles += [self.generator.register_forward_pre_hook(pre_hook), self.generator.register_forward_hook(hook)]
+        return self
+
+    def __exit__(self, *exc):
+        for handle in self.handles:
+            handle.remove()
+        for module, name in self.wrapped:
+            delattr(module, name)
+
+    def report(self, runs=1):
+        ms = lambda key: self.times.get(key, 0) * 1000 / runs
+        print("%-14s %-10s %10s %14s" % ('block', 'size', 'ms', 'modulation ms'))
+        if ('pyramid', 'total') in self.times:
+            print("%-14s %-10s %10.1f" % ('label pyramid', '', ms(('pyramid', 'total'))))
+        blocks = 0
+        for name, size in self.sizes.items():
+            blocks += ms((name, 'total'))
+            print("%-14s %-10s %10.1f %14.1f" % (name, '%dx%d' % size, ms((name, 'total')), ms((name, 'modulation'))))
+        print("%-14s %-10s %10.1f" % ('other', '', ms(('generator', 'total')) - blocks - ms(('pyramid', 'total'))))
+        print("%-14s %-10s %10.1f %14.1f" % ('generator', '', ms(('generator', 'total')),
+                                            sum(ms((name, 'modulation')) for name in self.sizes)))
+
+
+def profile_blocks(opt, inputs, tocg, generator, gauss):
+    # per-block generator times of one run_tryon, with the dense convs and with the label pyramid
+    with torch.inference_mode():
+        run_tryon(opt, inputs, tocg, generator, gauss)
+        for seg_pyramid in [False, True]:
+            generator.seg_pyramid = seg_pyramid
+            torch.manual_seed(0)
+            with BlockTimer(generator) as timer:
+                run_tryon(opt, inputs, tocg, generator, gauss)
+            print("\nseg pyramid %s:" % ('on' if seg_pyramid else 'off'))
+            timer.report()
+
+
+def main():
+    """
+        Times the eager fp32 path against the CPU inference mode at the configured
+        resolution, e.g.
+            python bench_inference.py --tocg_checkpoint ... --gen_checkpoint ... --num_threads 8 --jit trace
+        Extra flags: --iters N (default 3), --profile_blocks to print where the
+        eager generator spends its time, per SPADEResBlock and with or without
+        --seg_pyramid.
+    """
+    args = sys.argv[1:]
+    iters = 3
+    if '--iters' in args:
+        i = args.index('--iters')
+        iters = int(args[i + 1])
+        del args[i:i + 2]
+    profile = '--profile_blocks' in args
+    if profile:
+        args.remove('--profile_blocks')
+    opt = get_opt(args)
+    jit, opt.jit = opt.jit, 'none'
+    opt.cpu_fast = False
+
+    inputs = make_batch(opt, opt.batch_size)  # before build_models switches semantic_nc to the generator's
+    tocg, generator = build_models(opt)
+    tocg.eval()
+    generator.eval()
+    generator.seg_pyramid = False  # --seg_pyramid only applies to the CPU inference mode
+    gauss = GaussianBlur((15, 15), (3, 3))
+    print("threads: %d, batch: %d, %dx%d" % (torch.get_num_threads(), opt.batch_size, opt.fine_height, opt.fine_width))
+
+    baseline_ms, baseline, stats = benchmark(opt, inputs, tocg, generator, gauss, iters)
+    print("eager fp32:      %8.1f ms/image" % baseline_ms)
+    print("steady state:    %d grid builds, %d blur kernel builds, %d grid cache hits" % (
+        stats['grid_build'], stats['blur_kernel_build'], stats['grid_hit']))
+
+    opt.cpu_fast, opt.jit = True, jit
+    fast_tocg, fast_generator = prepare_inference(opt, copy.deepcopy(tocg), copy.deepcopy(generator))
+    fast_ms, fast, _ = benchmark(opt, inputs, fast_tocg, fast_generator, gauss, iters)
+    print("cpu_fast (%s): %8.1f ms/image  (x%.2f, max abs diff %.2e)" % (
+        jit, fast_ms, baseline_ms / fast_ms, (fast - baseline).abs().max().item()))
+
+    if profile:
+        profile_blocks(opt, inputs, tocg, generator, gauss)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from parse_labels import labels, remap_parse, label_onehot
+
+
+def loop_remap(im_parse, semantic_nc):
+    # the per-label loops the datasets used before the lookup table
+    h, w = im_parse.shape
+    parse = torch.from_numpy(im_parse[None]).long()
+    parse_map = torch.FloatTensor(20, h, w).zero_()
+    parse_map = parse_map.scatter_(0, parse, 1.0)
+    new_parse_map = torch.FloatTensor(semantic_nc, h, w).zero_()
+    for i in range(len(labels)):
+        for label in labels[i][1]:
+            new_parse_map[i] += parse_map[label]
+    parse_onehot = torch.FloatTensor(1, h, w).zero_()
+    for i in range(len(labels)):
+        for label in labels[i][1]:
+            parse_onehot[0] += parse_map[label] * i
+    return new_parse_map, parse_onehot
+
+
+def lut_remap(im_parse, semantic_nc):
+    parse = remap_parse(im_parse)
+    return label_onehot(parse, semantic_nc), parse.float()
+
+
+METHODS = {'loop': loop_remap, 'lut': lut_remap}
+
+
+def load_parse(opt):
+    if opt.parse is not None:
+        return np.array(Image.open(opt.parse).resize((opt.fine_width, opt.fine_height), Image.NEAREST))
+    return np.random.RandomState(0).randint(0, 20, (opt.fine_height, opt.fine_width)).astype(np.uint8)
+
+
+def run(method, opt, queue):
+    # runs in a fresh process so ru_maxrss only reflects this method
+    torch.set_num_threads(1)
+    im_parse = load_parse(opt)
+    fn = METHODS[method]
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fn(im_parse, opt.semantic_nc)
+    start = time.perf_counter()
+    for _ in range(opt.iters):
+        fn(im_parse, opt.semantic_nc)
+    elapsed = (time.perf_counter() - start) / opt.iters
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, peak - base, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parse", type=str, default=None, help="image-parse-v3 png, random labels if not given")
+    parser.add_argument("--fine_width", type=int, default=768)
+    parser.add_argument("--fine_height", type=int, default=1024)
+    parser.add_argument("--semantic_nc", type=int, default=13)
+    parser.add_argument("--iters", type=int, default=20)
+    opt = parser.parse_args()
+
+    im_parse = load_parse(opt)
+    for a, b in zip(loop_remap(im_parse, opt.semantic_nc), lut_remap(im_parse, opt.semantic_nc)):
+        assert torch.equal(a, b), "lookup table and loop remapping differ"
+
+    ctx = mp.get_context('spawn')
+    for method in METHODS:
+        queue = ctx.Queue()
+        p = ctx.Process(target=run, args=(method, opt, queue))
+        p.start()
+        elapsed, extra, peak = queue.get()
+        p.join()
+        print("%-5s %8.2f ms/sample  peak +%6.1f MB (max rss %.1f MB)" % (method, elapsed * 1000, extra / 1024, peak / 1024))
+
+
+if __name__ == "__main__":
+    main()
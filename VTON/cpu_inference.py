@@ -0,0 +1,67 @@
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+def remove_spectral_norms(model):
+    # bakes the normalized weights of every spectral-norm conv, so eval forwards skip the per-call division
+    for module in model.modules():
+        for hook in list(module._forward_pre_hooks.values()):
+            if type(hook).__name__ == 'SpectralNorm':
+                torch.nn.utils.remove_spectral_norm(module, hook.name)
+    return model
+
+
+def fuse_conv_bn(model):
+    # folds every eval-mode BatchNorm2d that directly follows a Conv2d in a Sequential into the conv
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        for i in range(len(module) - 1):
+            conv, bn = module[i], module[i + 1]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d) and bn.track_running_stats:
+                module[i] = fuse_conv_bn_eval(conv, bn)
+                module[i + 1] = nn.Identity()
+    return model
+
+
+def optimize_for_cpu(model, channels_last=True):
+    """
+        Prepares a loaded network for CPU inference: eval mode, frozen parameters,
+        spectral norms baked into the weights, conv + batch norm pairs fused and,
+        optionally, channels-last weights for the oneDNN convolution kernels.
+    """
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    remove_spectral_norms(model)
+    fuse_conv_bn(model)
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
+
+
+def compile_model(model, mode, example_inputs=None):
+    """
+        mode: 'none', 'trace' (TorchScript trace on `example_inputs`, frozen) or
+        'compile' (torch.compile). Returns the callable to run instead of `model`.
+    """
+    if mode == 'none':
+        return model
+    if mode == 'trace':
+        with torch.inference_mode(False), torch.no_grad():
+            traced = torch.jit.trace(model, example_inputs, check_trace=False)
+        return torch.jit.freeze(traced.eval())
+    if mode == 'compile':
+        # keep the eager random stream so SPADENorm noise matches the uncompiled networks
+        import torch._inductor.config as inductor_config
+        inductor_config.fallback_random = True
+        return torch.compile(model)
+    raise ValueError("unknown compile mode '{}'".format(mode))
+
+
+def to_channels_last(x):
+    # 4-d activations only, everything else is passed through
+    if torch.is_tensor(x) and x.dim() == 4:
+        return x.contiguous(memory_format=torch.channels_last)
+    return x
@@ -0,0 +1,81 @@
+import argparse
+import copy
+import time
+
+import torch
+from torch.utils.data.dataloader import default_collate
+
+from cp_dataset_test import CPDatasetTest
+from evaluate import ssim_score, load_lpips, lpips_score
+from networks import GaussianBlur
+from test_generator import get_opt, build_models, run_tryon
+from utils import tensor_to_image
+
+
+def run_precision(opt, samples, calib_samples):
+    # returns (ms per image, output images) for one precision setting
+    opt = copy.deepcopy(opt)
+    calib_batches = [default_collate([s]) for s in calib_samples] if opt.precision == 'int8' else None
+    tocg, generator = build_models(opt, calib_batches)
+    tocg.eval()
+    generator.eval()
+    gauss = GaussianBlur((15, 15), (3, 3))
+
+    images = []
+    elapsed = 0.0
+    with torch.inference_mode():
+        run_tryon(opt, default_collate([samples[0]]), tocg, generator, gauss)  # warm-up
+        for i, sample in enumerate(samples):
+            torch.manual_seed(i)  # same SPADE noise for every precision
+            start = time.perf_counter()
+            output = run_tryon(opt, default_collate([sample]), tocg, generator, gauss)['output']
+            elapsed += time.perf_counter() - start
+            images.append(tensor_to_image(output[0]))
+    return elapsed * 1000 / len(samples), images
+
+
+def main():
+    """
+        Latency / quality table of the inference precisions on the first test pairs.
+        Quality is measured against the fp32 outputs with evaluate.py's SSIM and,
+        when eval_models is available, LPIPS, e.g.
+            python eval_quantization.py --precisions fp32,bf16,int8 --num_samples 32 \\
+                --cpu_fast --tocg_checkpoint ... --gen_checkpoint ...
+        Every other flag is passed to test_generator.get_opt.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--precisions', default='fp32,bf16,int8')
+    parser.add_argument('--num_samples', type=int, default=16)
+    args, rest = parser.parse_known_args()
+    opt = get_opt(rest)
+
+    dataset = CPDatasetTest(opt)
+    num_calib = opt.calib_samples
+    samples = [dataset[i] for i in range(min(args.num_samples, len(dataset)))]
+    # calibrate on the pairs following the evaluated ones when there are enough of them
+    calib_range = range(len(samples), min(len(samples) + num_calib, len(dataset)))
+    calib_samples = [dataset[i] for i in calib_range] or samples[:num_calib]
+
+    try:
+        lpips_model = load_lpips(use_gpu=opt.cuda)
+    except ImportError:
+        print("eval_models is not available, skipping LPIPS")
+        lpips_model = None
+
+    reference = None
+    print("%-6s %12s %10s %10s" % ('', 'ms/image', 'SSIM', 'LPIPS'))
+    for precision in args.precisions.split(','):
+        opt.precision = precision
+        ms, images = run_precision(opt, samples, calib_samples)
+        if reference is None:
+            reference = images
+        ssim = sum(ssim_score(ref, img) for ref, img in zip(reference, images)) / len(images)
+        lpips = 'n/a'
+        if lpips_model is not None:
+            lpips = '%.4f' % (sum(lpips_score(lpips_model, ref, img, cuda=opt.cuda)
+                                  for ref, img in zip(reference, images)) / len(images))
+        print("%-6s %12.1f %10.4f %10s" % (precision, ms, ssim, lpips))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import os.path as osp
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def file_digest(*paths):
+    # content hash of one or more files, read in chunks so checkpoints can be hashed too
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def array_digest(*arrays):
+    # content hash of in-memory PIL images / arrays
+    h = hashlib.sha1()
+    for x in arrays:
+        x = np.ascontiguousarray(np.asarray(x))
+        h.update(str((x.dtype, x.shape)).encode())
+        h.update(x.tobytes())
+    return h.hexdigest()
+
+
+def map_tensors(value, fn):
+    # applies `fn` to every tensor of a nested dict / list structure
+    if torch.is_tensor(value):
+        return fn(value)
+    if isinstance(value, dict):
+        return {k: map_tensors(v, fn) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [map_tensors(v, fn) for v in value]
+    return value
+
+
+def tensor_bytes(value):
+    sizes = []
+    map_tensors(value, lambda t: sizes.append(t.numel() * t.element_size()))
+    return sum(sizes)
+
+
+class FeatureCache(object):
+    """
+        LRU cache of (nested) tensors keyed by content digest.
+
+        Entries live in memory up to `capacity` items and, if `max_bytes` is set,
+        up to that many bytes of tensor data; the least recently used entries are
+        evicted first. When `cache_dir` is set every entry is also written there
+        with torch.save and misses fall back to the on-disk store before being
+        recomputed.
+    """
+    def __init__(self, capacity=16, cache_dir=None, device=None, max_bytes=None):
+        super(FeatureCache, self).__init__()
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.device = device
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key):
+        return osp.join(self.cache_dir, key + '.pt')
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        if self.cache_dir is not None and osp.exists(self.path(key)):
+            value = torch.load(self.path(key), map_location='cpu')
+            if self.device is not None:
+                value = map_tensors(value, lambda t: t.to(self.device))
+            self.insert(key, value)
+            with self.lock:
+                self.disk_hits += 1
+            return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.insert(key, value)
+        if self.cache_dir is not None and not osp.exists(self.path(key)):
+            # write to a temporary name first so concurrent readers never see partial files
+            tmp_path = self.path(key) + '.tmp%d' % os.getpid()
+            torch.save(map_tensors(value, lambda t: t.cpu()), tmp_path)
+            os.replace(tmp_path, self.path(key))
+
+    def insert(self, key, value):
+        size = tensor_bytes(value)
+        if self.capacity <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.sizes[key]
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.sizes[key] = size
+            self.nbytes += size
+            while len(self.entries) > self.capacity or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                old_key, _ = self.entries.popitem(last=False)
+                self.nbytes -= self.sizes.pop(old_key)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'evictions': self.evictions}
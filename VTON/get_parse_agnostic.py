@@ -1,78 +1,130 @@
-import json
-from os import path as osp
-import os
-
-import numpy as np
-from PIL import Image, ImageDraw
-
-import argparse
-
-from tqdm import tqdm
-
-
-def get_im_parse_agnostic(im_parse, pose_data, w=768, h=1024):
-    parse_array = np.array(im_parse)
-    parse_upper = ((parse_array == 5).astype(np.float32) +
-                    (parse_array == 6).astype(np.float32) +
-                    (parse_array == 7).astype(np.float32))
-    parse_neck = (parse_array == 10).astype(np.float32)
-
-    r = 10
-    agnostic = im_parse.copy()
-
-    # mask arms
-    for parse_id, pose_ids in [(14, [2, 5, 6, 7]), (15, [5, 2, 3, 4])]:
-        mask_arm = Image.new('L', (w, h), 'black')
-        mask_arm_draw = ImageDraw.Draw(mask_arm)
-        i_prev = pose_ids[0]
-        for i in pose_ids[1:]:
-            if (pose_data[i_prev, 0] == 0.0 and pose_data[i_prev, 1] == 0.0) or (pose_data[i, 0] == 0.0 and pose_data[i, 1] == 0.0):
-                continue
-            mask_arm_draw.line([tuple(pose_data[j]) for j in [i_prev, i]], 'white', width=r*10)
-            pointx, pointy = pose_data[i]
-            radius = r*4 if i == pose_ids[-1] else r*15
-            mask_arm_draw.ellipse((pointx-radius, pointy-radius, pointx+radius, pointy+radius), 'white', 'white')
-            i_prev = i
-        parse_arm = (np.array(mask_arm) / 255) * (parse_array == parse_id).astype(np.float32)
-        agnostic.paste(0, None, Image.fromarray(np.uint8(parse_arm * 255), 'L'))
-
-    # mask torso & neck
-    agnostic.paste(0, None, Image.fromarray(np.uint8(parse_upper * 255), 'L'))
-    agnostic.paste(0, None, Image.fromarray(np.uint8(parse_neck * 255), 'L'))
-
-    return agnostic
-
-
-if __name__=="__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--data_path', type=str, help="dataset dir")
-    parser.add_argument('--output_path', type=str, help="output dir")
-
-    args = parser.parse_args()
-    data_path = args.data_path
-    output_path = args.output_path
-    
-    os.makedirs(output_path, exist_ok=True)
-    
-    for im_name in tqdm(os.listdir(osp.join(data_path, 'image'))):
-        
-        # load pose image
-        pose_name = im_name.replace('.jpg', '_keypoints.json')
-        
-        try:
-            with open(osp.join(data_path, 'openpose_json', pose_name), 'r') as f:
-                pose_label = json.load(f)
-                pose_data = pose_label['people'][0]['pose_keypoints_2d']
-                pose_data = np.array(pose_data)
-                pose_data = pose_data.reshape((-1, 3))[:, :2]
-        except IndexError:
-            print(pose_name)
-            continue
-
-        # load parsing image
-        parse_name = im_name.replace('.jpg', '.png')
-        im_parse = Image.open(osp.join(data_path, 'image-parse-v3', parse_name))
-
-        agnostic = get_im_parse_agnostic(im_parse, pose_data)
-        
-        agnostic.save(osp.join(output_path, parse_name))
+import multiprocessing
+from os import path as osp
+import os
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+
+import argparse
+
+from tqdm import tqdm
+
+from agnostic import get_parse_agnostic_batch
+from keypoint_table import KeypointTable
+
+
+def get_im_parse_agnostic(im_parse, pose_data, w=768, h=1024):
+    parse_array = np.array(im_parse)
+    parse_upper = ((parse_array == 5).astype(np.float32) +
+                    (parse_array == 6).astype(np.float32) +
+                    (parse_array == 7).astype(np.float32))
+    parse_neck = (parse_array == 10).astype(np.float32)
+
+    r = 10
+    agnostic = im_parse.copy()
+
+    # mask arms
+    for parse_id, pose_ids in [(14, [2, 5, 6, 7]), (15, [5, 2, 3, 4])]:
+        mask_arm = Image.new('L', (w, h), 'black')
+        mask_arm_draw = ImageDraw.Draw(mask_arm)
+        i_prev = pose_ids[0]
+        for i in pose_ids[1:]:
+            if (pose_data[i_prev, 0] == 0.0 and pose_data[i_prev, 1] == 0.0) or (pose_data[i, 0] == 0.0 and pose_data[i, 1] == 0.0):
+                continue
+            mask_arm_draw.line([tuple(pose_data[j]) for j in [i_prev, i]], 'white', width=r*10)
+            pointx, pointy = pose_data[i]
+            radius = r*4 if i == pose_ids[-1] else r*15
+            mask_arm_draw.ellipse((pointx-radius, pointy-radius, pointx+radius, pointy+radius), 'white', 'white')
+            i_prev = i
+        parse_arm = (np.array(mask_arm) / 255) * (parse_array == parse_id).astype(np.float32)
+        agnostic.paste(0, None, Image.fromarray(np.uint8(parse_arm * 255), 'L'))
+
+    # mask torso & neck
+    agnostic.paste(0, None, Image.fromarray(np.uint8(parse_upper * 255), 'L'))
+    agnostic.paste(0, None, Image.fromarray(np.uint8(parse_neck * 255), 'L'))
+
+    return agnostic
+
+
+def save_parse(parse, path):
+    # write under a temporary name first so an interrupted run never leaves a truncated output behind
+    parse.save(path + '.tmp', format='PNG')
+    os.replace(path + '.tmp', path)
+
+
+def process_chunk(args):
+    """
+        Writes the parse-agnostic maps for one chunk of image names and returns
+        the chunk size and the names that had no detected person.
+    """
+    data_path, output_path, im_names, vectorized = args
+    keypoints = KeypointTable(data_path)
+    skipped = []
+    parses, poses, parse_names = [], [], []
+    for im_name in im_names:
+        pose_data = keypoints.get(im_name)
+        if pose_data is None:
+            skipped.append(im_name)
+            continue
+        parse_name = im_name.replace('.jpg', '.png')
+        im_parse = Image.open(osp.join(data_path, 'image-parse-v3', parse_name))
+        if vectorized:
+            parses.append(im_parse)
+            poses.append(pose_data)
+            parse_names.append(parse_name)
+        else:
+            agnostic = get_im_parse_agnostic(im_parse, pose_data, w=im_parse.size[0], h=im_parse.size[1])
+            save_parse(agnostic, osp.join(output_path, parse_name))
+
+    if parses:
+        # images of different sizes are rasterized in separate batches
+        for size in set(im_parse.size for im_parse in parses):
+            rows = [i for i, im_parse in enumerate(parses) if im_parse.size == size]
+            agnostic = get_parse_agnostic_batch(torch.stack([torch.from_numpy(np.array(parses[i])) for i in rows]),
+                                                torch.stack([torch.from_numpy(poses[i]).float() for i in rows]))
+            for i, parse in zip(rows, agnostic.numpy()):
+                out = Image.fromarray(parse, 'L')
+                if parses[i].mode == 'P':
+                    out = out.convert('P')
+                    out.putpalette(parses[i].getpalette())
+                save_parse(out, osp.join(output_path, parse_names[i]))
+    return len(im_names), skipped
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', type=str, help="dataset dir")
+    parser.add_argument('--output_path', type=str, help="output dir")
+    parser.add_argument('-j', '--workers', type=int, default=1, help="worker processes")
+    parser.add_argument('--chunk_size', type=int, default=32, help="images per worker task")
+    parser.add_argument('--vectorized', action='store_true', help="rasterize the arm masks as batched tensors")
+    parser.add_argument('--overwrite', action='store_true', help="regenerate outputs that already exist")
+
+    args = parser.parse_args()
+    data_path = args.data_path
+    output_path = args.output_path
+    
+    os.makedirs(output_path, exist_ok=True)
+
+    im_names = sorted(os.listdir(osp.join(data_path, 'image')))
+    if not args.overwrite:
+        im_names = [im_name for im_name in im_names
+                    if not osp.exists(osp.join(output_path, im_name.replace('.jpg', '.png')))]
+    chunks = [(data_path, output_path, im_names[i:i + args.chunk_size], args.vectorized)
+              for i in range(0, len(im_names), args.chunk_size)]
+
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers, initializer=torch.set_num_threads, initargs=(1,))
+        results = pool.imap_unordered(process_chunk, chunks)
+    else:
+        results = map(process_chunk, chunks)
+
+    with tqdm(total=len(im_names)) as pbar:
+        for num_done, skipped in results:
+            for im_name in skipped:
+                print(im_name.replace('.jpg', '_keypoints.json'))
+            pbar.update(num_done)
+    if args.workers > 1:
+        pool.close()
+        pool.join()
@@ -0,0 +1,290 @@
+import os.path as osp
+import threading
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data.dataloader import default_collate
+
+from cp_dataset_test import CPDatasetTest
+from fabric_pattern_applier import resize_pattern, apply_pattern_to_mask
+from feature_cache import FeatureCache, file_digest, array_digest
+from network_generator import latent_scale
+from networks import GaussianBlur
+from packed_dataset import read_pairs
+from quantization import autocast, to_float
+from result_cache import ResultCache, model_digest, result_key
+from test_generator import get_opt, build_models, make_input1, make_input2, run_tryon, run_condition, run_generator
+from utils import tensor_to_image
+
+
+PREVIEW_RUNGS = 2  # halvings of the output size tried as previews
+
+
+def preview_sizes(opt, rungs=PREVIEW_RUNGS):
+    """
+        The preview ladder, coarsest first: the output size halved up to `rungs`
+        times, keeping the sizes that are a multiple of the generator's latent
+        scale. The generator rounds other sizes up to its latent grid and
+        resizes the result, so they would come out stretched (256x192 with the
+        default 'most' upsampling, whose latent scale is 128).
+    """
+    scale = latent_scale(opt.num_upsampling_layers)
+    sizes = []
+    for i in range(rungs, 0, -1):
+        step = scale * 2**i
+        if opt.fine_height % step == 0 and opt.fine_width % step == 0:
+            sizes.append((opt.fine_height // 2**i, opt.fine_width // 2**i))
+    return tuple(sizes)
+
+
+def as_image(x):
+    # accepts PIL images or HxW / HxWx3 uint8 arrays
+    if isinstance(x, np.ndarray):
+        return Image.fromarray(x)
+    return x
+
+
+def as_keypoints(pose_keypoints):
+    # accepts the raw openpose `pose_keypoints_2d` list or a (25, 2) / (25, 3) array
+    pose_data = np.array(pose_keypoints, dtype=np.float64)
+    if pose_data.ndim == 1:
+        pose_data = pose_data.reshape((-1, 3))
+    return pose_data[:, :2]
+
+
+class TryOnEngine(object):
+    """
+        Long-lived HR-VITON inference engine.
+
+        The condition generator and the SPADE generator are built and loaded once
+        and kept in eval mode, so a try-on only costs the forward pass instead of
+        a fresh `test_generator.py` process per request.
+
+        Everything that depends on the person only (agnostic image, densepose and
+        the PoseEncoder pyramid) is kept in an LRU cache of `person_cache_size`
+        entries, optionally persisted to `person_cache_dir`. Symmetrically, the
+        normalized cloth / mask and the ClothEncoder pyramid are kept per garment
+        and fabric pattern, bounded by `garment_cache_size` entries and
+        `garment_cache_bytes` bytes. Persisted entries are keyed by the model
+        digest too (see result_cache.model_digest), so a directory reused with
+        other checkpoints or options never serves stale features.
+
+        With `result_cache_dir` set, full-resolution outputs of file-based pairs
+        are stored there by content (see result_cache.py), up to
+        `result_cache_bytes`, and identical requests are served from disk.
+
+        With `precision='int8'` the activation ranges are calibrated on the first
+        `calib_samples` pairs of `<dataroot>/<calib_list>`, or of the pair list
+        at `calib_path` when it is given. With `backend='onnx'`
+        both networks run in ONNX Runtime from the graphs in `onnx_dir`
+        (see onnx_export.py). `models` are an already built (tocg, generator)
+        pair, e.g. the shared-memory networks of an InferencePool.
+    """
+    def __init__(self, opt=None, person_cache_size=16, person_cache_dir=None,
+                 garment_cache_size=64, garment_cache_bytes=512 * 2**20, garment_cache_dir=None,
+                 result_cache_dir=None, result_cache_bytes=2 * 2**30, calib_list='test_pairs.txt', calib_path=None, models=None, **kwargs):
+        super(TryOnEngine, self).__init__()
+        if opt is None:
+            opt = get_opt([])
+        for key, value in kwargs.items():
+            setattr(opt, key, value)
+        opt.data_list = None
+        opt.datasetting = 'unpaired'
+        self.opt = opt
+
+        # the dataset only serves as the sample builder for single pairs
+        self.dataset = CPDatasetTest(opt)
+        self.data_path = self.dataset.data_path
+
+        calib_batches = None
+        if opt.precision == 'int8' and models is None:
+            im_names, c_names = read_pairs(calib_path or osp.join(opt.dataroot, calib_list))
+            calib_batches = [default_collate([self.dataset.get_pair(im_name, {'unpaired': c_name})])
+                             for im_name, c_name in list(zip(im_names, c_names))[:opt.calib_samples]]
+        self.tocg, self.generator = models if models is not None else build_models(opt, calib_batches)
+        self.tocg.eval()
+        self.generator.eval()
+
+        self.gauss = GaussianBlur((15, 15), (3, 3))
+        self.preview_sizes = preview_sizes(opt)
+        if opt.cuda:
+            self.tocg.cuda()
+            self.gauss = self.gauss.cuda()
+
+        self.device = 'cuda' if opt.cuda else 'cpu'
+        self.person_cache = FeatureCache(person_cache_size, person_cache_dir, device=self.device)
+        self.garment_cache = FeatureCache(garment_cache_size, garment_cache_dir, device=self.device, max_bytes=garment_cache_bytes)
+        self.model_key = None
+        if result_cache_dir is not None or person_cache_dir is not None or garment_cache_dir is not None:
+            self.model_key = model_digest(opt)
+        self.result_cache = None
+        if result_cache_dir is not None:
+            self.result_cache = ResultCache(result_cache_dir, result_cache_bytes)
+
+        self.lock = threading.Lock()
+
+    def load_cloth(self, cloth, pattern=None):
+        # returns the (cloth, cloth-mask) PIL pair, with the fabric pattern applied in memory
+        cloth_path = osp.join(self.data_path, 'cloth', cloth)
+        mask_path = osp.join(self.data_path, 'cloth-mask', cloth)
+        if pattern is None:
+            return Image.open(cloth_path).convert('RGB'), Image.open(mask_path)
+
+        shirt = cv2.imread(cloth_path)
+        fabric = cv2.imread(pattern)
+        mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+        if shirt is None or fabric is None or mask is None:
+            raise ValueError(f"Could not load one or more input images for pattern application.\nCloth: {cloth_path}\nPattern: {pattern}\nMask: {mask_path}")
+        patterned = apply_pattern_to_mask(shirt, resize_pattern(fabric, shirt.shape), mask)
+        patterned = Image.fromarray(cv2.cvtColor(patterned, cv2.COLOR_BGR2RGB))
+        return patterned, Image.fromarray(mask, 'L')
+
+    def encode_person(self, person):
+        # person: the person half of a dataset sample, returns the garment-independent features
+        with torch.inference_mode():
+            parse_agnostic = person['parse_agnostic'][None].to(self.device)
+            densepose = person['densepose'][None].to(self.device)
+            input2 = make_input2(parse_agnostic, densepose)
+            with autocast(self.opt):
+                E2_list = to_float(self.tocg.encode_pose(input2))
+        return {
+            'agnostic': person['agnostic'].to(self.device),
+            'densepose': densepose[0],
+            'input2': input2[0],
+            'E2_list': [E2[0] for E2 in E2_list],
+            }
+
+    def stored_key(self, cache, key):
+        # features persisted to disk only hold for the networks and options that computed them
+        return key if cache.cache_dir is None else self.model_key + '_' + key
+
+    def person_features(self, key, load):
+        return self.person_cache.get_or_compute(self.stored_key(self.person_cache, key), lambda: self.encode_person(load()))
+
+    def encode_garment(self, cloth):
+        # cloth: the garment half of a dataset sample, returns the person-independent features
+        with torch.inference_mode():
+            clothes = cloth['cloth']['unpaired'][None].to(self.device)
+            clothes_mask = (cloth['cloth_mask']['unpaired'][None] > 0.5).float().to(self.device)
+            input1 = make_input1(clothes, clothes_mask)
+            with autocast(self.opt):
+                E1_list = to_float(self.tocg.encode_cloth(input1))
+        return {
+            'cloth': {'unpaired': clothes[0]},
+            'cloth_mask': {'unpaired': clothes_mask[0]},
+            'input1': input1[0],
+            'E1_list': [E1[0] for E1 in E1_list],
+            }
+
+    def garment_features(self, key, load):
+        return self.garment_cache.get_or_compute(self.stored_key(self.garment_cache, key), lambda: self.encode_garment(load()))
+
+    def prepare(self, person, cloth, pattern=None):
+        """
+            Builds an (uncollated) input sample for the person image `person` and the
+            cloth `cloth`, both file names inside `<dataroot>/<datamode>`.
+            `pattern` is an optional path to a fabric texture applied to the cloth.
+        """
+        sample = dict(self.person_features(self.person_key(person), lambda: self.dataset.get_person(person)))
+
+        def load():
+            c, cm = self.load_cloth(cloth, pattern)
+            return self.dataset.make_cloth({'unpaired': c}, {'unpaired': cm})
+        sample.update(self.garment_features(self.garment_key(cloth, pattern), load))
+        return sample
+
+    def person_key(self, person):
+        # every input of get_person: the image, parse, parse-agnostic, pose and densepose maps and the keypoints,
+        # so regenerating any of them (e.g. get_parse_agnostic.py --overwrite) changes the key
+        pose_data = self.dataset.keypoints.get(person)
+        return file_digest(*self.dataset.person_files(person).values()) + '_' + array_digest(pose_data if pose_data is not None else np.empty((0, 2)))
+
+    def garment_key(self, cloth, pattern=None):
+        cloth_files = [osp.join(self.data_path, 'cloth', cloth), osp.join(self.data_path, 'cloth-mask', cloth)]
+        return file_digest(*cloth_files) + '_' + (file_digest(pattern) if pattern is not None else 'none')
+
+    def result_key(self, person, cloth, pattern=None):
+        # content key of the full-resolution output of a file-based pair, None without a result cache
+        if self.result_cache is None:
+            return None
+        return result_key(self.model_key, self.person_key(person), self.garment_key(cloth, pattern))
+
+    def cached_output(self, key):
+        # the stored (3, H, W) output of a result_key, or None
+        return None if key is None else self.result_cache.get(key)
+
+    def store_output(self, key, output):
+        if key is not None:
+            self.result_cache.put(key, output)
+
+    def prepare_arrays(self, person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic=None):
+        """
+            Builds an (uncollated) input sample from in-memory PIL images / NumPy arrays.
+            `parse` and `parse_agnostic` are label maps; the parse-agnostic map is derived
+            from `parse` and `pose_keypoints` when it is not given.
+        """
+        person, parse, densepose = as_image(person), as_image(parse), as_image(densepose)
+        pose_data = as_keypoints(pose_keypoints)
+        if parse_agnostic is not None:
+            parse_agnostic = as_image(parse_agnostic)
+        key_arrays = [person, parse, densepose, pose_data] + ([parse_agnostic] if parse_agnostic is not None else [])
+        load = lambda: self.dataset.make_person(person, parse, pose_data, densepose, image_parse_agnostic=parse_agnostic)
+        sample = dict(self.person_features(array_digest(*key_arrays), load))
+
+        cloth, cloth_mask = as_image(cloth), as_image(cloth_mask)
+        load = lambda: self.dataset.make_cloth({'unpaired': cloth}, {'unpaired': cloth_mask})
+        sample.update(self.garment_features(array_digest(cloth, cloth_mask), load))
+        return sample
+
+    def forward(self, inputs):
+        # inputs: a collated batch, returns the generator output in [-1, 1]
+        with self.lock, torch.inference_mode():
+            result = run_tryon(self.opt, inputs, self.tocg, self.generator, self.gauss, keep_segmap=False)
+        return result['output']
+
+    def tryon_output(self, person, cloth, pattern=None):
+        # the (3, H, W) output tensor in [-1, 1], from the result cache when it holds the pair
+        key = self.result_key(person, cloth, pattern)
+        output = self.cached_output(key)
+        if output is None:
+            output = self.forward(default_collate([self.prepare(person, cloth, pattern)]))[0].cpu()
+            self.store_output(key, output)
+        return output
+
+    def tryon(self, person, cloth, pattern=None):
+        return tensor_to_image(self.tryon_output(person, cloth, pattern))
+
+    def render(self, sample, sizes):
+        """
+            Yields the (3, H, W) output of one uncollated sample for every (H, W) in
+            `sizes`, None standing for opt.fine_height x opt.fine_width. The condition
+            generator runs once for all sizes and the lock is released between them,
+            so other requests are not held up by a resolution ladder.
+        """
+        inputs = default_collate([sample])
+        with self.lock, torch.inference_mode():
+            condition = run_condition(self.opt, inputs, self.tocg)
+        for size in sizes:
+            with self.lock, torch.inference_mode():
+                output = run_generator(self.opt, condition, self.generator, self.gauss, size, keep_segmap=False)['output']
+            yield output[0]
+
+    def tryon_progressive(self, person, cloth, pattern=None, sizes=None):
+        # PIL previews at each of `sizes` (self.preview_sizes by default), then the full-resolution result;
+        # a cached result comes alone
+        key = self.result_key(person, cloth, pattern)
+        output = self.cached_output(key)
+        if output is None:
+            sizes = self.preview_sizes if sizes is None else sizes
+            for output in self.render(self.prepare(person, cloth, pattern), list(sizes) + [None]):
+                yield tensor_to_image(output)
+            self.store_output(key, output.cpu())
+            return
+        yield tensor_to_image(output)
+
+    def tryon_arrays(self, person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic=None):
+        # in-memory try-on without any file access, returns the (3, H, W) output tensor in [-1, 1]
+        sample = self.prepare_arrays(person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic)
+        return self.forward(default_collate([sample]))[0].cpu()
@@ -0,0 +1,267 @@
+import argparse
+import collections
+import copy
+import os
+import os.path as osp
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+
+from inference_engine import TryOnEngine
+from packed_dataset import read_pairs
+from test_generator import get_opt, build_models
+from utils import tensor_to_image
+
+
+AFFINITY_SIZE = 1024  # persons remembered by the dispatcher
+
+
+def shareable(opt):
+    # eager CPU networks pickle with their tensors in shared memory; traced or compiled graphs,
+    # int8 modules and ONNX Runtime sessions are built by every worker instead
+    return opt.backend == 'torch' and opt.precision != 'int8' and opt.jit == 'none' and not opt.cuda
+
+
+def worker_cores(rank, threads):
+    # the rank-th block of `threads` cores this process may run on, None when there are not enough of them
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    cores = sorted(os.sched_getaffinity(0))[rank * threads:(rank + 1) * threads]
+    return cores if len(cores) == threads else None
+
+
+def serve(rank, opt, models, threads, cores, engine_kwargs, requests, results):
+    # worker process: one TryOnEngine answering (request_id, method, args) until it reads None
+    torch.set_num_threads(threads)
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    opt.num_threads = threads
+    try:
+        engine = TryOnEngine(opt, models=models, **engine_kwargs)
+    except Exception as e:
+        results.put((rank, None, None, e))
+        return
+    results.put((rank, None, os.getpid(), None))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, method, args = request
+        try:
+            results.put((rank, request_id, getattr(engine, method)(*args), None))
+        except Exception as e:
+            results.put((rank, request_id, None, e))
+
+
+class InferencePool(object):
+    """
+        Process-pool front end for CPU serving: `num_workers` spawned processes
+        each run a TryOnEngine (with its own person / garment caches) on
+        `threads_per_worker` intra-op threads, pinned to their own block of
+        cores when `pin_cores` is set and there are enough of them.
+
+        The condition generator and the SPADE generator are built once in this
+        process and their parameters moved to shared memory, so the workers map
+        the same weights instead of loading a copy each. Options whose networks
+        cannot be shared (see shareable) fall back to one build per worker.
+
+        A dispatcher sends every request to the worker with the fewest requests
+        in flight; on a tie, to the worker that last served the same person,
+        whose person cache still holds its features. Keyword arguments that are
+        test_generator options override `opt`, the others go to TryOnEngine.
+    """
+    def __init__(self, opt=None, num_workers=2, threads_per_worker=0, pin_cores=True, **kwargs):
+        super(InferencePool, self).__init__()
+        if opt is None:
+            opt = get_opt([])
+        for key in [key for key in kwargs if hasattr(opt, key)]:
+            setattr(opt, key, kwargs.pop(key))
+        self.num_workers = num_workers
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+
+        models = None
+        if shareable(opt):
+            # build_models switches opt.semantic_nc to the generator's, the workers' datasets need the original
+            build_opt = copy.deepcopy(opt)
+            build_opt.num_threads = 0
+            models = build_models(build_opt)
+            for model in models:
+                model.eval()
+                model.share_memory()
+        self.shared = models is not None
+
+        # spawned rather than forked, so every worker starts its own torch thread pool
+        context = mp.get_context('spawn')
+        self.results = context.Queue()
+        self.requests = [context.Queue() for _ in range(num_workers)]
+        self.procs = []
+        for rank in range(num_workers):
+            cores = worker_cores(rank, self.threads) if pin_cores else None
+            proc = context.Process(target=serve, daemon=True,
+                                   args=(rank, opt, models, self.threads, cores, kwargs, self.requests[rank], self.results))
+            proc.start()
+            self.procs.append(proc)
+        self.wait_ready()
+
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.next_id = 0
+        self.in_flight = [0] * num_workers
+        self.served = [0] * num_workers
+        self.affinity = collections.OrderedDict()
+        self.thread = threading.Thread(target=self.collect, daemon=True)
+        self.thread.start()
+
+    def wait_ready(self):
+        # every worker posts once its engine is built; a worker killed while loading (e.g. out of memory) posts nothing
+        ready = set()
+        while len(ready) < self.num_workers:
+            try:
+                rank, _, _, error = self.results.get(timeout=1)
+            except queue.Empty:
+                for rank, proc in enumerate(self.procs):
+                    if rank not in ready and not proc.is_alive():
+                        self.terminate()
+                        raise RuntimeError("inference worker %d exited with code %s while starting" % (rank, proc.exitcode))
+                continue
+            if error is not None:
+                self.terminate()
+                raise RuntimeError("inference worker %d failed to start" % rank) from error
+            ready.add(rank)
+
+    def pick(self, affinity):
+        least = min(self.in_flight)
+        if least == float('inf'):
+            raise RuntimeError("no inference worker left")
+        rank = self.affinity.get(affinity)
+        if rank is None or self.in_flight[rank] > least:
+            rank = self.in_flight.index(least)
+        if affinity is not None:
+            self.affinity[affinity] = rank
+            self.affinity.move_to_end(affinity)
+            if len(self.affinity) > AFFINITY_SIZE:
+                self.affinity.popitem(last=False)
+        return rank
+
+    def submit(self, method, *args, affinity=None):
+        # runs engine.<method>(*args) on a worker, returns a Future of its result
+        future = Future()
+        with self.lock:
+            rank = self.pick(affinity)
+            request_id = self.next_id
+            self.next_id += 1
+            self.futures[request_id] = (rank, future)
+            self.in_flight[rank] += 1
+        self.requests[rank].put((request_id, method, args))
+        return future
+
+    def tryon(self, person, cloth, pattern=None):
+        return tensor_to_image(self.submit('tryon_output', person, cloth, pattern, affinity=person).result())
+
+    def tryon_arrays(self, person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic=None):
+        # returns the (3, H, W) output tensor in [-1, 1], see TryOnEngine.tryon_arrays
+        return self.submit('tryon_arrays', person, parse, densepose, pose_keypoints, cloth, cloth_mask, parse_agnostic).result()
+
+    def collect(self):
+        while True:
+            try:
+                item = self.results.get(timeout=1)
+            except queue.Empty:
+                self.check_workers()
+                continue
+            if item is None:
+                break
+            rank, request_id, output, error = item
+            with self.lock:
+                entry = self.futures.pop(request_id, None)
+                if entry is not None:
+                    self.in_flight[rank] -= 1
+                    self.served[rank] += 1
+            if entry is None:
+                # a late result of a request check_workers already failed
+                continue
+            _, future = entry
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(output)
+
+    def check_workers(self):
+        # fails the requests of a worker that died and stops dispatching to it
+        for rank, proc in enumerate(self.procs):
+            if proc.is_alive() or self.in_flight[rank] == float('inf'):
+                continue
+            with self.lock:
+                self.in_flight[rank] = float('inf')
+                lost = [(request_id, future) for request_id, (r, future) in self.futures.items() if r == rank]
+                for request_id, _ in lost:
+                    del self.futures[request_id]
+            for _, future in lost:
+                future.set_exception(RuntimeError("inference worker %d exited with code %s" % (rank, proc.exitcode)))
+
+    def stats(self):
+        return {'workers': self.num_workers, 'threads_per_worker': self.threads, 'shared_weights': self.shared,
+                'served': list(self.served)}
+
+    def terminate(self):
+        for proc in self.procs:
+            proc.terminate()
+
+    def close(self):
+        for requests in self.requests:
+            requests.put(None)
+        for proc in self.procs:
+            proc.join()
+        self.results.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    """
+        Throughput of an InferencePool on a pair list, e.g.
+            python inference_pool.py --num_workers 4 --threads_per_worker 4 --requests 64 \\
+                --cpu_fast --tocg_checkpoint ... --gen_checkpoint ...
+        The pairs are submitted at once, as concurrent clients would, and cycled
+        until --requests try-ons are done. --pairs defaults to
+        --dataroot/--data_list; every other flag is passed to
+        test_generator.get_opt.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=str, default=None, help='pair list, defaults to --dataroot/--data_list')
+    parser.add_argument('--num_workers', type=int, default=2, help='worker processes')
+    parser.add_argument('--threads_per_worker', type=int, default=0, help='intra-op threads per worker, 0 splits the cores evenly')
+    parser.add_argument('--no_pin', action='store_true', help='do not pin the workers to their own cores')
+    parser.add_argument('--requests', type=int, default=0, help='try-ons to run, 0 runs every pair once')
+    args, rest = parser.parse_known_args()
+    opt = get_opt(rest)
+    im_names, c_names = read_pairs(args.pairs or osp.join(opt.dataroot, opt.data_list))
+    pairs = list(zip(im_names, c_names))
+    num_requests = args.requests or len(pairs)
+
+    start = time.time()
+    with InferencePool(opt, args.num_workers, args.threads_per_worker, pin_cores=not args.no_pin) as pool:
+        print("%d workers x %d threads up in %.1f s, %s weights" % (
+            pool.num_workers, pool.threads, time.time() - start, 'shared' if pool.shared else 'per-worker'))
+        start = time.time()
+        futures = [pool.submit('tryon_output', *pairs[i % len(pairs)], affinity=pairs[i % len(pairs)][0])
+                   for i in range(num_requests)]
+        for future in futures:
+            future.result()
+        elapsed = time.time() - start
+        print("%d try-ons in %.1f s, %.2f images/s, per worker %s" % (
+            num_requests, elapsed, num_requests / elapsed, pool.stats()['served']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import os.path as osp
+
+import numpy as np
+from tqdm import tqdm
+
+
+TABLE_NAME = 'openpose_keypoints.npy'
+INDEX_NAME = 'openpose_keypoints.json'
+
+
+def read_keypoints(data_path, im_name):
+    # parses openpose_json/<name>_keypoints.json, returns (25, 2) keypoints or None when nobody was detected
+    pose_name = im_name.replace('.jpg', '_keypoints.json')
+    with open(osp.join(data_path, 'openpose_json', pose_name), 'r') as f:
+        pose_label = json.load(f)
+    if len(pose_label['people']) == 0:
+        return None
+    pose_data = pose_label['people'][0]['pose_keypoints_2d']
+    pose_data = np.array(pose_data)
+    return pose_data.reshape((-1, 3))[:, :2]
+
+
+def build_keypoint_table(data_path, im_names=None):
+    """
+        Parses the openpose json of every image of a split once and writes the
+        keypoints as one (N, 25, 2) float64 array next to the split folders,
+        plus a json list of image names giving the row order. Rows of images
+        without a detected person are NaN.
+    """
+    if im_names is None:
+        im_names = sorted(os.listdir(osp.join(data_path, 'image')))
+    table = np.full((len(im_names), 25, 2), np.nan)
+    for i, im_name in enumerate(tqdm(im_names)):
+        pose_data = read_keypoints(data_path, im_name)
+        if pose_data is not None:
+            table[i] = pose_data
+    np.save(osp.join(data_path, TABLE_NAME), table)
+    with open(osp.join(data_path, INDEX_NAME), 'w') as f:
+        json.dump(im_names, f)
+
+
+class KeypointTable(object):
+    """
+        Name -> keypoint lookup backed by the table written by build_keypoint_table.
+
+        The table is memory-mapped on first use, so forked DataLoader workers share
+        the pages. Names missing from the table, or splits without a table, fall
+        back to reading the json files.
+    """
+    def __init__(self, data_path):
+        super(KeypointTable, self).__init__()
+        self.data_path = data_path
+        self.table = None
+        self.rows = None
+
+    def load(self):
+        table_path = osp.join(self.data_path, TABLE_NAME)
+        if not osp.exists(table_path):
+            self.rows = {}
+            return
+        self.table = np.load(table_path, mmap_mode='r')
+        with open(osp.join(self.data_path, INDEX_NAME), 'r') as f:
+            self.rows = {name: i for i, name in enumerate(json.load(f))}
+
+    def get(self, im_name):
+        # (25, 2) float64 keypoints, or None when nobody was detected
+        if self.rows is None:
+            self.load()
+        row = self.rows.get(im_name)
+        if row is None:
+            return read_keypoints(self.data_path, im_name)
+        pose_data = np.array(self.table[row])
+        if np.isnan(pose_data).any():
+            return None
+        return pose_data
+
+    def __getitem__(self, im_name):
+        pose_data = self.get(im_name)
+        if pose_data is None:
+            raise IndexError("no person detected in %s" % im_name)
+        return pose_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', type=str, help="dataset split dir, e.g. ./data/zalando-hd-resize/train")
+
+    args = parser.parse_args()
+    build_keypoint_table(args.data_path)
@@ -1,497 +1,650 @@
-import torch.nn as nn
-import torch
-class CBAM(nn.Module):
-    def __init__(self, channels, reduction=16, kernel_size=7):
-        super(CBAM, self).__init__()
-        self.avg_pool = nn.AdaptiveAvgPool2d(1)
-        self.max_pool = nn.AdaptiveMaxPool2d(1)
-
-        self.fc = nn.Sequential(
-            nn.Conv2d(channels, channels // reduction, 1, bias=False),
-            nn.ReLU(),
-            nn.Conv2d(channels // reduction, channels, 1, bias=False)
-        )
-        self.sigmoid_channel = nn.Sigmoid()
-
-        self.conv_spatial = nn.Conv2d(2, 1, kernel_size=kernel_size, padding=kernel_size//2, bias=False)
-        self.sigmoid_spatial = nn.Sigmoid()
-
-    def forward(self, x):
-        avg_out = self.fc(self.avg_pool(x))
-        max_out = self.fc(self.max_pool(x))
-        channel_att = self.sigmoid_channel(avg_out + max_out)
-        x = x * channel_att
-
-        avg_out = torch.mean(x, dim=1, keepdim=True)
-        max_out, _ = torch.max(x, dim=1, keepdim=True)
-        spatial_att = self.sigmoid_spatial(self.conv_spatial(torch.cat([avg_out, max_out], dim=1)))
-        x = x * spatial_att
-        return x
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-from torch.nn import init
-from torch.nn.utils import spectral_norm
-import numpy as np
-
-
-class BaseNetwork(nn.Module):
-    def __init__(self):
-        super(BaseNetwork, self).__init__()
-
-    def print_network(self):
-        num_params = 0
-        for param in self.parameters():
-            num_params += param.numel()
-        print("Network [{}] was created. Total number of parameters: {:.1f} million. "
-              "To see the architecture, do print(network).".format(self.__class__.__name__, num_params / 1000000))
-
-    def init_weights(self, init_type='normal', gain=0.02):
-        def init_func(m):
-            classname = m.__class__.__name__
-            if 'BatchNorm2d' in classname:
-                if hasattr(m, 'weight') and m.weight is not None:
-                    init.normal_(m.weight.data, 1.0, gain)
-                if hasattr(m, 'bias') and m.bias is not None:
-                    init.constant_(m.bias.data, 0.0)
-            elif ('Conv' in classname or 'Linear' in classname) and hasattr(m, 'weight'):
-                if init_type == 'normal':
-                    init.normal_(m.weight.data, 0.0, gain)
-                elif init_type == 'xavier':
-                    init.xavier_normal_(m.weight.data, gain=gain)
-                elif init_type == 'xavier_uniform':
-                    init.xavier_uniform_(m.weight.data, gain=1.0)
-                elif init_type == 'kaiming':
-                    init.kaiming_normal_(m.weight.data, a=0, mode='fan_in')
-                elif init_type == 'orthogonal':
-                    init.orthogonal_(m.weight.data, gain=gain)
-                elif init_type == 'none':  # uses pytorch's default init method
-                    m.reset_parameters()
-                else:
-                    raise NotImplementedError("initialization method '{}' is not implemented".format(init_type))
-                if hasattr(m, 'bias') and m.bias is not None:
-                    init.constant_(m.bias.data, 0.0)
-
-        self.apply(init_func)
-
-    def forward(self, *inputs):
-        pass
-
-
-class MaskNorm(nn.Module):
-    def __init__(self, norm_nc):
-        super(MaskNorm, self).__init__()
-
-        self.norm_layer = nn.InstanceNorm2d(norm_nc, affine=False)
-
-    def normalize_region(self, region, mask):
-        b, c, h, w = region.size()
-
-        num_pixels = mask.sum((2, 3), keepdim=True)  # size: (b, 1, 1, 1)
-        num_pixels[num_pixels == 0] = 1
-        mu = region.sum((2, 3), keepdim=True) / num_pixels  # size: (b, c, 1, 1)
-
-        normalized_region = self.norm_layer(region + (1 - mask) * mu)
-        return normalized_region * torch.sqrt(num_pixels / (h * w))
-
-    def forward(self, x, mask):
-        mask = mask.detach()
-        normalized_foreground = self.normalize_region(x * mask, mask)
-        normalized_background = self.normalize_region(x * (1 - mask), 1 - mask)
-        return normalized_foreground + normalized_background
-
-
-class SPADENorm(nn.Module):
-    def __init__(self,opt, norm_type, norm_nc, label_nc):
-        super(SPADENorm, self).__init__()
-        self.param_opt=opt
-        self.noise_scale = nn.Parameter(torch.zeros(norm_nc))
-
-        assert norm_type.startswith('alias')
-        param_free_norm_type = norm_type[len('alias'):]
-        if param_free_norm_type == 'batch':
-            self.param_free_norm = nn.BatchNorm2d(norm_nc, affine=False)
-        elif param_free_norm_type == 'instance':
-            self.param_free_norm = nn.InstanceNorm2d(norm_nc, affine=False)
-        elif param_free_norm_type == 'mask':
-            self.param_free_norm = MaskNorm(norm_nc)
-        else:
-            raise ValueError(
-                "'{}' is not a recognized parameter-free normalization type in SPADENorm".format(param_free_norm_type)
-            )
-
-        nhidden = 128
-        ks = 3
-        pw = ks // 2
-        self.conv_shared = nn.Sequential(nn.Conv2d(label_nc, nhidden, kernel_size=ks, padding=pw), nn.ReLU())
-        self.conv_gamma = nn.Conv2d(nhidden, norm_nc, kernel_size=ks, padding=pw)
-        self.conv_beta = nn.Conv2d(nhidden, norm_nc, kernel_size=ks, padding=pw)
-
-    def forward(self, x, seg, misalign_mask=None):
-        # Part 1. Generate parameter-free normalized activations.
-        b, c, h, w = x.size()
-        if self.param_opt.cuda :
-            noise = (torch.randn(b, w, h, 1).cuda() * self.noise_scale).transpose(1, 3)
-        else:
-            noise = (torch.randn(b, w, h, 1)* self.noise_scale).transpose(1, 3)
-
-
-        if misalign_mask is None:
-            normalized = self.param_free_norm(x + noise)
-        else:
-            normalized = self.param_free_norm(x + noise, misalign_mask)
-
-        # Part 2. Produce affine parameters conditioned on the segmentation map.
-        actv = self.conv_shared(seg)
-        gamma = self.conv_gamma(actv)
-        beta = self.conv_beta(actv)
-
-        # Apply the affine parameters.
-        output = normalized * (1 + gamma) + beta
-        return output
-
-
-class SPADEResBlock(nn.Module):
-    def __init__(self, opt, input_nc, output_nc, use_mask_norm=True):
-        super(SPADEResBlock, self).__init__()
-        self.param_opt=opt
-        self.learned_shortcut = (input_nc != output_nc)
-        middle_nc = min(input_nc, output_nc)
-
-        self.conv_0 = nn.Conv2d(input_nc, middle_nc, kernel_size=3, padding=1)
-        self.conv_1 = nn.Conv2d(middle_nc, output_nc, kernel_size=3, padding=1)
-        if self.learned_shortcut:
-            self.conv_s = nn.Conv2d(input_nc, output_nc, kernel_size=1, bias=False)
-
-        subnorm_type = opt.norm_G
-        if subnorm_type.startswith('spectral'):
-            subnorm_type = subnorm_type[len('spectral'):]
-            self.conv_0 = spectral_norm(self.conv_0)
-            self.conv_1 = spectral_norm(self.conv_1)
-            if self.learned_shortcut:
-                self.conv_s = spectral_norm(self.conv_s)
-
-        gen_semantic_nc = opt.gen_semantic_nc
-        if use_mask_norm:
-            subnorm_type = 'aliasmask'
-            gen_semantic_nc = gen_semantic_nc + 1
-
-        self.norm_0 = SPADENorm(opt,subnorm_type, input_nc, gen_semantic_nc)
-        self.norm_1 = SPADENorm(opt,subnorm_type, middle_nc, gen_semantic_nc)
-        if self.learned_shortcut:
-            self.norm_s = SPADENorm(opt,subnorm_type, input_nc, gen_semantic_nc)
-
-        self.relu = nn.LeakyReLU(0.2)
-
-    def shortcut(self, x, seg, misalign_mask):
-        if self.learned_shortcut:
-            return self.conv_s(self.norm_s(x, seg, misalign_mask))
-        else:
-            return x
-
-    def forward(self, x, seg, misalign_mask=None):
-        seg = F.interpolate(seg, size=x.size()[2:], mode='nearest')
-        if misalign_mask is not None:
-            misalign_mask = F.interpolate(misalign_mask, size=x.size()[2:], mode='nearest')
-
-        x_s = self.shortcut(x, seg, misalign_mask)
-
-        dx = self.conv_0(self.relu(self.norm_0(x, seg, misalign_mask)))
-        dx = self.conv_1(self.relu(self.norm_1(dx, seg, misalign_mask)))
-        output = x_s + dx
-        return output
-
-
-class SPADEGenerator(BaseNetwork):
-    def __init__(self, opt, input_nc):
-        super(SPADEGenerator, self).__init__()
-        self.num_upsampling_layers = opt.num_upsampling_layers
-        self.param_opt=opt
-        self.sh, self.sw = self.compute_latent_vector_size(opt)
-
-        nf = opt.ngf
-        self.conv_0 = nn.Conv2d(input_nc, nf * 16, kernel_size=3, padding=1)
-        for i in range(1, 8):
-            self.add_module('conv_{}'.format(i), nn.Conv2d(input_nc, 16, kernel_size=3, padding=1))
-
-        self.head_0 = SPADEResBlock(opt, nf * 16, nf * 16, use_mask_norm=False)
-
-        self.G_middle_0 = SPADEResBlock(opt, nf * 16 + 16, nf * 16, use_mask_norm=False)
-        self.G_middle_1 = SPADEResBlock(opt, nf * 16 + 16, nf * 16, use_mask_norm=False)
-
-        self.up_0 = SPADEResBlock(opt, nf * 16 + 16, nf * 8, use_mask_norm=False)
-        self.up_1 = SPADEResBlock(opt, nf * 8 + 16, nf * 4, use_mask_norm=False)
-        self.up_2 = SPADEResBlock(opt, nf * 4 + 16, nf * 2, use_mask_norm=False)
-        self.up_3 = SPADEResBlock(opt, nf * 2 + 16, nf * 1, use_mask_norm=False)
-        if self.num_upsampling_layers == 'most':
-            self.up_4 = SPADEResBlock(opt, nf * 1 + 16, nf // 2, use_mask_norm=False)
-            nf = nf // 2
-
-        self.conv_img = nn.Conv2d(nf, 3, kernel_size=3, padding=1)
-
-        self.up = nn.Upsample(scale_factor=2, mode='nearest')
-        self.relu = nn.LeakyReLU(0.2)
-        self.tanh = nn.Tanh()
-
-    def compute_latent_vector_size(self, opt):
-        if self.num_upsampling_layers == 'normal':
-            num_up_layers = 5
-        elif self.num_upsampling_layers == 'more':
-            num_up_layers = 6
-        elif self.num_upsampling_layers == 'most':
-            num_up_layers = 7
-        else:
-            raise ValueError("opt.num_upsampling_layers '{}' is not recognized".format(self.num_upsampling_layers))
-
-        sh = opt.fine_height // 2**num_up_layers
-        sw = opt.fine_width // 2**num_up_layers
-        return sh, sw
-
-    def forward(self, x, seg):
-        samples = [F.interpolate(x, size=(self.sh * 2**i, self.sw * 2**i), mode='nearest') for i in range(8)]
-        features = [self._modules['conv_{}'.format(i)](samples[i]) for i in range(8)]
-
-        x = self.head_0(features[0], seg)
-        x = self.up(x)
-        x = self.G_middle_0(torch.cat((x, features[1]), 1), seg)
-        if self.num_upsampling_layers in ['more', 'most']:
-            x = self.up(x)
-        x = self.G_middle_1(torch.cat((x, features[2]), 1), seg)
-
-        x = self.up(x)
-        x = self.up_0(torch.cat((x, features[3]), 1), seg)
-        x = self.up(x)
-        x = self.up_1(torch.cat((x, features[4]), 1), seg)
-        x = self.up(x)
-        x = self.up_2(torch.cat((x, features[5]), 1), seg)
-        x = self.up(x)
-        x = self.up_3(torch.cat((x, features[6]), 1), seg)
-        if self.num_upsampling_layers == 'most':
-            x = self.up(x)
-            x = self.up_4(torch.cat((x, features[7]), 1), seg)
-
-        x = self.conv_img(self.relu(x))
-        return self.tanh(x)
-########################################################################
-
-########################################################################
-    
-class NLayerDiscriminator(BaseNetwork):
-
-    def __init__(self, opt):
-        super().__init__()
-        self.no_ganFeat_loss = opt.no_ganFeat_loss
-        nf = opt.ndf
-
-        kw = 4
-        pw = int(np.ceil((kw - 1.0) / 2))
-        norm_layer = get_nonspade_norm_layer(opt.norm_D)
-
-        input_nc = opt.gen_semantic_nc + 3
-        # input_nc = opt.gen_semantic_nc + 13
-        sequence = [[nn.Conv2d(input_nc, nf, kernel_size=kw, stride=2, padding=pw),
-                     nn.LeakyReLU(0.2, False)]]
-
-        for n in range(1, opt.n_layers_D):
-            nf_prev = nf
-            nf = min(nf * 2, 512)
-            sequence += [[norm_layer(nn.Conv2d(nf_prev, nf, kernel_size=kw, stride=2, padding=pw)),
-                          nn.LeakyReLU(0.2, False)]]
-
-        sequence += [[nn.Conv2d(nf, 1, kernel_size=kw, stride=1, padding=pw)]]
-
-        # We divide the layers into groups to extract intermediate layer outputs
-        for n in range(len(sequence)):
-            self.add_module('model' + str(n), nn.Sequential(*sequence[n]))
-
-    def forward(self, input):
-        results = [input]
-        for submodel in self.children():
-            intermediate_output = submodel(results[-1])
-            results.append(intermediate_output)
-
-        get_intermediate_features = not self.no_ganFeat_loss
-        if get_intermediate_features:
-            return results[1:]
-        else:
-            return results[-1]
-
-
-class MultiscaleDiscriminator(BaseNetwork):
-
-    def __init__(self, opt):
-        super().__init__()
-        self.no_ganFeat_loss = opt.no_ganFeat_loss
-
-        for i in range(opt.num_D):
-            subnetD = NLayerDiscriminator(opt)
-            self.add_module('discriminator_%d' % i, subnetD)
-
-    def downsample(self, input):
-        return F.avg_pool2d(input, kernel_size=3, stride=2, padding=[1, 1], count_include_pad=False)
-
-    # Returns list of lists of discriminator outputs.
-    # The final result is of size opt.num_D x opt.n_layers_D
-    def forward(self, input):
-        result = []
-        get_intermediate_features = not self.no_ganFeat_loss
-        for name, D in self.named_children():
-            out = D(input)
-            if not get_intermediate_features:
-                out = [out]
-            result.append(out)
-            input = self.downsample(input)
-
-        return result
-    
-class GANLoss(nn.Module):
-    def __init__(self, gan_mode, target_real_label=1.0, target_fake_label=0.0, tensor=torch.FloatTensor):
-        super(GANLoss, self).__init__()
-        self.real_label = target_real_label
-        self.fake_label = target_fake_label
-        self.real_label_tensor = None
-        self.fake_label_tensor = None
-        self.zero_tensor = None
-        self.Tensor = tensor
-        self.gan_mode = gan_mode
-        if gan_mode == 'ls':
-            pass
-        elif gan_mode == 'original':
-            pass
-        elif gan_mode == 'w':
-            pass
-        elif gan_mode == 'hinge':
-            pass
-        else:
-            raise ValueError('Unexpected gan_mode {}'.format(gan_mode))
-
-    def get_target_tensor(self, input, target_is_real):
-        if target_is_real:
-            if self.real_label_tensor is None:
-                self.real_label_tensor = self.Tensor(1).fill_(self.real_label)
-                self.real_label_tensor.requires_grad_(False)
-            return self.real_label_tensor.expand_as(input)
-        else:
-            if self.fake_label_tensor is None:
-                self.fake_label_tensor = self.Tensor(1).fill_(self.fake_label)
-                self.fake_label_tensor.requires_grad_(False)
-            return self.fake_label_tensor.expand_as(input)
-
-    def get_zero_tensor(self, input):
-        if self.zero_tensor is None:
-            self.zero_tensor = self.Tensor(1).fill_(0)
-            self.zero_tensor.requires_grad_(False)
-        return self.zero_tensor.expand_as(input)
-
-    def loss(self, input, target_is_real, for_discriminator=True):
-        if self.gan_mode == 'original':  # cross entropy loss
-            target_tensor = self.get_target_tensor(input, target_is_real)
-            loss = F.binary_cross_entropy_with_logits(input, target_tensor)
-            return loss
-        elif self.gan_mode == 'ls':
-            target_tensor = self.get_target_tensor(input, target_is_real)
-            return F.mse_loss(input, target_tensor)
-        elif self.gan_mode == 'hinge':
-            if for_discriminator:
-                if target_is_real:
-                    minval = torch.min(input - 1, self.get_zero_tensor(input))
-                    loss = -torch.mean(minval)
-                else:
-                    minval = torch.min(-input - 1, self.get_zero_tensor(input))
-                    loss = -torch.mean(minval)
-            else:
-                assert target_is_real, "The generator's hinge loss must be aiming for real"
-                loss = -torch.mean(input)
-            return loss
-        else:
-            # wgan
-            if target_is_real:
-                return -input.mean()
-            else:
-                return input.mean()
-
-    def __call__(self, input, target_is_real, for_discriminator=True):
-        # computing loss is a bit complicated because |input| may not be
-        # a tensor, but list of tensors in case of multiscale discriminator
-        if isinstance(input, list):
-            loss = 0
-            for pred_i in input:
-                if isinstance(pred_i, list):
-                    pred_i = pred_i[-1]
-                loss_tensor = self.loss(pred_i, target_is_real, for_discriminator)
-                bs = 1 if len(loss_tensor.size()) == 0 else loss_tensor.size(0)
-                new_loss = torch.mean(loss_tensor.view(bs, -1), dim=1)
-                loss += new_loss
-            return loss / len(input)
-        else:
-            return self.loss(input, target_is_real, for_discriminator)
-
-
-def get_nonspade_norm_layer(norm_type='instance'):
-    def get_out_channel(layer):
-        if hasattr(layer, 'out_channels'):
-            return getattr(layer, 'out_channels')
-        return layer.weight.size(0)
-
-    def add_norm_layer(layer):
-        nonlocal norm_type
-        if norm_type.startswith('spectral'):
-            layer = spectral_norm(layer)
-            subnorm_type = norm_type[len('spectral'):]
-
-        if subnorm_type == 'none' or len(subnorm_type) == 0:
-            return layer
-
-        # remove bias in the previous layer, which is meaningless
-        # since it has no effect after normalization
-        if getattr(layer, 'bias', None) is not None:
-            delattr(layer, 'bias')
-            layer.register_parameter('bias', None)
-
-        if subnorm_type == 'batch':
-            norm_layer = nn.BatchNorm2d(get_out_channel(layer), affine=True)
-        # elif subnorm_type == 'sync_batch':
-        #     norm_layer = SynchronizedBatchNorm2d(get_out_channel(layer), affine=True)
-        elif subnorm_type == 'instance':
-            norm_layer = nn.InstanceNorm2d(get_out_channel(layer), affine=False)
-        else:
-            raise ValueError('normalization layer %s is not recognized' % subnorm_type)
-
-        return nn.Sequential(layer, norm_layer)
-
-    return add_norm_layer
-
-
-
-class ResBlock(nn.Module):
-    def __init__(self, in_nc, out_nc, scale='down', norm_layer=nn.BatchNorm2d):
-        super(ResBlock, self).__init__()
-        use_bias = norm_layer == nn.InstanceNorm2d
-        assert scale in ['up', 'down', 'same'], "ResBlock scale must be in 'up' 'down' 'same'"
-
-        if scale == 'same':
-            self.scale = nn.Conv2d(in_nc, out_nc, kernel_size=1, bias=True)
-        if scale == 'up':
-            self.scale = nn.Sequential(
-                nn.Upsample(scale_factor=2, mode='bilinear'),
-                nn.Conv2d(in_nc, out_nc, kernel_size=1, bias=True)
-            )
-        if scale == 'down':
-            self.scale = nn.Conv2d(in_nc, out_nc, kernel_size=3, stride=2, padding=1, bias=use_bias)
-
-        self.block = nn.Sequential(
-            nn.Conv2d(out_nc, out_nc, kernel_size=3, stride=1, padding=1, bias=use_bias),
-            norm_layer(out_nc),
-            nn.ReLU(inplace=True),
-            nn.Conv2d(out_nc, out_nc, kernel_size=3, stride=1, padding=1, bias=use_bias),
-            norm_layer(out_nc)
-        )
-
-        self.attention = CBAM(out_nc)
-        self.relu = nn.ReLU(inplace=True)
-
-    def forward(self, x):
-        residual = self.scale(x)
-        out = self.block(residual)
-        out = self.attention(out)
-        return self.relu(residual + out)
+import torch.nn as nn
+import torch
+class CBAM(nn.Module):
+    def __init__(self, channels, reduction=16, kernel_size=7):
+        super(CBAM, self).__init__()
+        self.avg_pool = nn.AdaptiveAvgPool2d(1)
+        self.max_pool = nn.AdaptiveMaxPool2d(1)
+
+        self.fc = nn.Sequential(
+            nn.Conv2d(channels, channels // reduction, 1, bias=False),
+            nn.ReLU(),
+            nn.Conv2d(channels // reduction, channels, 1, bias=False)
+        )
+        self.sigmoid_channel = nn.Sigmoid()
+
+        self.conv_spatial = nn.Conv2d(2, 1, kernel_size=kernel_size, padding=kernel_size//2, bias=False)
+        self.sigmoid_spatial = nn.Sigmoid()
+
+    def forward(self, x):
+        avg_out = self.fc(self.avg_pool(x))
+        max_out = self.fc(self.max_pool(x))
+        channel_att = self.sigmoid_channel(avg_out + max_out)
+        x = x * channel_att
+
+        avg_out = torch.mean(x, dim=1, keepdim=True)
+        max_out, _ = torch.max(x, dim=1, keepdim=True)
+        spatial_att = self.sigmoid_spatial(self.conv_spatial(torch.cat([avg_out, max_out], dim=1)))
+        x = x * spatial_att
+        return x
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.nn import init
+from torch.nn.utils import spectral_norm
+import numpy as np
+
+
+class BaseNetwork(nn.Module):
+    def __init__(self):
+        super(BaseNetwork, self).__init__()
+
+    def print_network(self):
+        num_params = 0
+        for param in self.parameters():
+            num_params += param.numel()
+        print("Network [{}] was created. Total number of parameters: {:.1f} million. "
+              "To see the architecture, do print(network).".format(self.__class__.__name__, num_params / 1000000))
+
+    def init_weights(self, init_type='normal', gain=0.02):
+        def init_func(m):
+            classname = m.__class__.__name__
+            if 'BatchNorm2d' in classname:
+                if hasattr(m, 'weight') and m.weight is not None:
+                    init.normal_(m.weight.data, 1.0, gain)
+                if hasattr(m, 'bias') and m.bias is not None:
+                    init.constant_(m.bias.data, 0.0)
+            elif ('Conv' in classname or 'Linear' in classname) and hasattr(m, 'weight'):
+                if init_type == 'normal':
+                    init.normal_(m.weight.data, 0.0, gain)
+                elif init_type == 'xavier':
+                    init.xavier_normal_(m.weight.data, gain=gain)
+                elif init_type == 'xavier_uniform':
+                    init.xavier_uniform_(m.weight.data, gain=1.0)
+                elif init_type == 'kaiming':
+                    init.kaiming_normal_(m.weight.data, a=0, mode='fan_in')
+                elif init_type == 'orthogonal':
+                    init.orthogonal_(m.weight.data, gain=gain)
+                elif init_type == 'none':  # uses pytorch's default init method
+                    m.reset_parameters()
+                else:
+                    raise NotImplementedError("initialization method '{}' is not implemented".format(init_type))
+                if hasattr(m, 'bias') and m.bias is not None:
+                    init.constant_(m.bias.data, 0.0)
+
+        self.apply(init_func)
+
+    def forward(self, *inputs):
+        pass
+
+
+class MaskNorm(nn.Module):
+    def __init__(self, norm_nc):
+        super(MaskNorm, self).__init__()
+
+        self.norm_layer = nn.InstanceNorm2d(norm_nc, affine=False)
+
+    def normalize_region(self, region, mask):
+        b, c, h, w = region.size()
+
+        num_pixels = mask.sum((2, 3), keepdim=True)  # size: (b, 1, 1, 1)
+        num_pixels[num_pixels == 0] = 1
+        mu = region.sum((2, 3), keepdim=True) / num_pixels  # size: (b, c, 1, 1)
+
+        normalized_region = self.norm_layer(region + (1 - mask) * mu)
+        return normalized_region * torch.sqrt(num_pixels / (h * w))
+
+    def forward(self, x, mask):
+        mask = mask.detach()
+        normalized_foreground = self.normalize_region(x * mask, mask)
+        normalized_background = self.normalize_region(x * (1 - mask), 1 - mask)
+        return normalized_foreground + normalized_background
+
+
+class SPADENorm(nn.Module):
+    def __init__(self,opt, norm_type, norm_nc, label_nc):
+        super(SPADENorm, self).__init__()
+        self.param_opt=opt
+        self.noise_scale = nn.Parameter(torch.zeros(norm_nc))
+        self.set_noise('random')
+
+        assert norm_type.startswith('alias')
+        param_free_norm_type = norm_type[len('alias'):]
+        if param_free_norm_type == 'batch':
+            self.param_free_norm = nn.BatchNorm2d(norm_nc, affine=False)
+        elif param_free_norm_type == 'instance':
+            self.param_free_norm = nn.InstanceNorm2d(norm_nc, affine=False)
+        elif param_free_norm_type == 'mask':
+            self.param_free_norm = MaskNorm(norm_nc)
+        else:
+            raise ValueError(
+                "'{}' is not a recognized parameter-free normalization type in SPADENorm".format(param_free_norm_type)
+            )
+
+        nhidden = 128
+        ks = 3
+        pw = ks // 2
+        self.conv_shared = nn.Sequential(nn.Conv2d(label_nc, nhidden, kernel_size=ks, padding=pw), nn.ReLU())
+        self.conv_gamma = nn.Conv2d(nhidden, norm_nc, kernel_size=ks, padding=pw)
+        self.conv_beta = nn.Conv2d(nhidden, norm_nc, kernel_size=ks, padding=pw)
+
+    def set_noise(self, mode, seed=0):
+        """
+            'random' draws new noise on every call, 'fixed' reuses one (1, 1, H, W)
+            buffer per resolution drawn from `seed` for every sample, so a
+            pair renders the same in any batch, and 'off' skips the noise. Norms
+            with a zero noise_scale skip it in both inference modes.
+        """
+        if mode != 'random' and not self.noise_scale.any():
+            mode = 'off'
+        self.noise, self.noise_seed, self.noise_buffers = mode, seed, {}
+
+    def noise_buffer(self, x):
+        key = (tuple(x.shape[2:]), x.device, x.dtype)
+        if key not in self.noise_buffers:
+            generator = torch.Generator(device=x.device).manual_seed(self.noise_seed)
+            with torch.inference_mode(False):
+                noise = torch.randn((1, 1) + key[0], generator=generator, device=x.device)
+                self.noise_buffers[key] = noise.to(x.dtype)
+        return self.noise_buffers[key]
+
+    def modulation(self, seg, level=None):
+        # Part 2 below: the (gamma, beta) maps at x's resolution, from seg or from its label_windows level
+        if level is not None:
+            return label_modulation(self, level)
+        actv = self.conv_shared(seg)
+        return self.conv_gamma(actv), self.conv_beta(actv)
+
+    def forward(self, x, seg, misalign_mask=None, level=None):
+        # level: a label_windows level of seg at x's resolution, replaces seg (see SPADEGenerator.label_pyramid)
+        # Part 1. Generate parameter-free normalized activations.
+        if self.noise == 'off':
+            noisy = x
+        elif self.noise == 'fixed':
+            noisy = torch.addcmul(x, self.noise_buffer(x), self.noise_scale.view(1, -1, 1, 1))
+        else:
+            # the values of torch.randn(b, w, h, 1) on x's device, drawn like a view of x so
+            # the ONNX exporter can infer the shape
+            noise = torch.randn_like(x.transpose(1, 3)[..., :1], memory_format=torch.contiguous_format)
+            noisy = x + (noise * self.noise_scale).transpose(1, 3)
+
+        if misalign_mask is None:
+            normalized = self.param_free_norm(noisy)
+        else:
+            normalized = self.param_free_norm(noisy, misalign_mask)
+
+        # Part 2. Produce affine parameters conditioned on the segmentation map.
+        gamma, beta = self.modulation(seg, level)
+
+        # Apply the affine parameters.
+        output = normalized * (1 + gamma) + beta
+        return output
+
+
+class SPADEResBlock(nn.Module):
+    def __init__(self, opt, input_nc, output_nc, use_mask_norm=True):
+        super(SPADEResBlock, self).__init__()
+        self.param_opt=opt
+        self.learned_shortcut = (input_nc != output_nc)
+        middle_nc = min(input_nc, output_nc)
+
+        self.conv_0 = nn.Conv2d(input_nc, middle_nc, kernel_size=3, padding=1)
+        self.conv_1 = nn.Conv2d(middle_nc, output_nc, kernel_size=3, padding=1)
+        if self.learned_shortcut:
+            self.conv_s = nn.Conv2d(input_nc, output_nc, kernel_size=1, bias=False)
+
+        subnorm_type = opt.norm_G
+        if subnorm_type.startswith('spectral'):
+            subnorm_type = subnorm_type[len('spectral'):]
+            self.conv_0 = spectral_norm(self.conv_0)
+            self.conv_1 = spectral_norm(self.conv_1)
+            if self.learned_shortcut:
+                self.conv_s = spectral_norm(self.conv_s)
+
+        gen_semantic_nc = opt.gen_semantic_nc
+        if use_mask_norm:
+            subnorm_type = 'aliasmask'
+            gen_semantic_nc = gen_semantic_nc + 1
+
+        self.norm_0 = SPADENorm(opt,subnorm_type, input_nc, gen_semantic_nc)
+        self.norm_1 = SPADENorm(opt,subnorm_type, middle_nc, gen_semantic_nc)
+        if self.learned_shortcut:
+            self.norm_s = SPADENorm(opt,subnorm_type, input_nc, gen_semantic_nc)
+
+        self.relu = nn.LeakyReLU(0.2)
+
+    def norms(self):
+        names = ['norm_0', 'norm_1'] + (['norm_s'] if self.learned_shortcut else [])
+        return [(name, self._modules[name]) for name in names]
+
+    def shortcut(self, x, seg, misalign_mask, level=None):
+        if self.learned_shortcut:
+            return self.conv_s(self.norm_s(x, seg, misalign_mask, level))
+        else:
+            return x
+
+    def forward(self, x, seg, misalign_mask=None, level=None):
+        if level is None:
+            seg = F.interpolate(seg, size=x.size()[2:], mode='nearest')
+        if misalign_mask is not None:
+            misalign_mask = F.interpolate(misalign_mask, size=x.size()[2:], mode='nearest')
+
+        x_s = self.shortcut(x, seg, misalign_mask, level)
+
+        dx = self.conv_0(self.relu(self.norm_0(x, seg, misalign_mask, level)))
+        dx = self.conv_1(self.relu(self.norm_1(dx, seg, misalign_mask, level)))
+        output = x_s + dx
+        return output
+
+
+def label_windows(labels, num_labels):
+    """
+        Splits a (N, H, W) label map for label_modulation: the pixels whose 5x5
+        window (the receptive field of SPADENorm's two 3x3 convs) lies inside the
+        map and holds a single label, and the distinct windows of all other
+        pixels, with `num_labels` standing for outside the map.
+    """
+    N, H, W = labels.shape
+    x = labels[:, None].float()
+    uniform = F.max_pool2d(x, 5, 1, 2) == -F.max_pool2d(-x, 5, 1, 2)
+    inside = torch.zeros_like(uniform)
+    inside[:, :, 2:-2, 2:-2] = True
+    index = (~(uniform & inside)).view(-1).nonzero()[:, 0]
+
+    padded = F.pad(labels, (2, 2, 2, 2), value=num_labels)
+    b, yx = index // (H * W), index % (H * W)
+    y, x = yx // W, yx % W
+    offsets = torch.arange(5, device=labels.device)
+    rows = (y[:, None] + offsets)[:, :, None]
+    cols = (x[:, None] + offsets)[:, None, :]
+    windows = padded[b[:, None, None], rows, cols].view(-1, 25)
+    patterns, inverse = torch.unique(windows, dim=0, return_inverse=True)
+    return {'labels': labels, 'num_labels': num_labels, 'index': index, 'patterns': patterns, 'inverse': inverse}
+
+
+def label_modulation(norm, level):
+    """
+        norm.modulation() of the one-hot map of level['labels'] (see label_windows).
+        Pixels with a uniform window take a per-label constant; the convs only run
+        once per distinct boundary window, on its 5x5 one-hot patch without padding.
+    """
+    num_labels = level['num_labels']
+    conv_shared = norm.conv_shared[0]
+    weight = torch.cat([norm.conv_gamma.weight, norm.conv_beta.weight])
+    bias = torch.cat([norm.conv_gamma.bias, norm.conv_beta.bias])
+    c = norm.conv_gamma.out_channels
+
+    actv = F.relu(conv_shared.bias + conv_shared.weight.sum((2, 3)).t())
+    table = bias + actv @ weight.sum((2, 3)).t()
+    # gathered channel-major, an NHWC result would slow down the affine of SPADENorm
+    N, H, W = level['labels'].shape
+    out = table.t().index_select(1, level['labels'].view(-1))
+
+    patterns = level['patterns']
+    if patterns.size(0) > 0:
+        u = patterns.size(0)
+        onehot = F.one_hot(patterns, num_labels + 1)[:, :, :num_labels].to(weight.dtype)
+        actv = F.relu(F.conv2d(onehot.view(u, 5, 5, num_labels).permute(0, 3, 1, 2), conv_shared.weight, conv_shared.bias))
+        # the second conv zero-pads the activations outside the map
+        actv = actv * (patterns.view(u, 5, 5)[:, None, 1:4, 1:4] != num_labels)
+        # a 3x3 conv with a 1x1 output, as a single matrix product
+        values = torch.addmm(bias, actv.reshape(u, -1), weight.view(2 * c, -1).t())
+        out.index_copy_(1, level['index'], values[level['inverse']].t())
+    gamma, beta = out.view(2 * c, N, H, W).transpose(0, 1).split(c, 1)
+    return gamma, beta
+
+
+def latent_scale(num_upsampling_layers):
+    # output size / latent grid size of a SPADEGenerator
+    if num_upsampling_layers == 'normal':
+        num_up_layers = 5
+    elif num_upsampling_layers == 'more':
+        num_up_layers = 6
+    elif num_upsampling_layers == 'most':
+        num_up_layers = 7
+    else:
+        raise ValueError("opt.num_upsampling_layers '{}' is not recognized".format(num_upsampling_layers))
+    return 2**num_up_layers
+
+
+class SPADEGenerator(BaseNetwork):
+    def __init__(self, opt, input_nc):
+        super(SPADEGenerator, self).__init__()
+        self.num_upsampling_layers = opt.num_upsampling_layers
+        self.param_opt=opt
+
+        nf = opt.ngf
+        self.conv_0 = nn.Conv2d(input_nc, nf * 16, kernel_size=3, padding=1)
+        for i in range(1, 8):
+            self.add_module('conv_{}'.format(i), nn.Conv2d(input_nc, 16, kernel_size=3, padding=1))
+
+        self.head_0 = SPADEResBlock(opt, nf * 16, nf * 16, use_mask_norm=False)
+
+        self.G_middle_0 = SPADEResBlock(opt, nf * 16 + 16, nf * 16, use_mask_norm=False)
+        self.G_middle_1 = SPADEResBlock(opt, nf * 16 + 16, nf * 16, use_mask_norm=False)
+
+        self.up_0 = SPADEResBlock(opt, nf * 16 + 16, nf * 8, use_mask_norm=False)
+        self.up_1 = SPADEResBlock(opt, nf * 8 + 16, nf * 4, use_mask_norm=False)
+        self.up_2 = SPADEResBlock(opt, nf * 4 + 16, nf * 2, use_mask_norm=False)
+        self.up_3 = SPADEResBlock(opt, nf * 2 + 16, nf * 1, use_mask_norm=False)
+        if self.num_upsampling_layers == 'most':
+            self.up_4 = SPADEResBlock(opt, nf * 1 + 16, nf // 2, use_mask_norm=False)
+            nf = nf // 2
+
+        self.conv_img = nn.Conv2d(nf, 3, kernel_size=3, padding=1)
+
+        self.up = nn.Upsample(scale_factor=2, mode='nearest')
+        self.relu = nn.LeakyReLU(0.2)
+        self.tanh = nn.Tanh()
+        # condition the norms on label_pyramid() in eager inference, see prepare_inference
+        self.seg_pyramid = False
+
+    def latent_scale(self):
+        return latent_scale(self.num_upsampling_layers)
+
+    def set_noise(self, mode, seed=0):
+        # SPADENorm.set_noise on every norm, each with its own seed
+        norms = [module for module in self.modules() if isinstance(module, SPADENorm)]
+        for i, norm in enumerate(norms):
+            norm.set_noise(mode, seed + i)
+
+    def block_sizes(self, h, w):
+        # (block name, resolution) of the SPADEResBlocks for an (h, w) input, in forward order
+        scale = self.latent_scale()
+        sh, sw = -(-h // scale), -(-w // scale)
+        names = ['head_0', 'G_middle_0', 'G_middle_1', 'up_0', 'up_1', 'up_2', 'up_3']
+        ups = [0, 1, int(self.num_upsampling_layers in ['more', 'most']), 1, 1, 1, 1]
+        if self.num_upsampling_layers == 'most':
+            names.append('up_4')
+            ups.append(1)
+        sizes, level = [], 0
+        for name, up in zip(names, ups):
+            level += up
+            sizes.append((name, (sh * 2**level, sw * 2**level)))
+        return sizes
+
+    def label_pyramid(self, seg, size=None):
+        """
+            label_windows of the one-hot parse `seg` at the resolution of every
+            SPADEResBlock for an output of `size` (seg's size by default), as
+            {block name: level} for forward(). Blocks of the same resolution share
+            their level, and every norm of a block computes its modulation from it
+            (label_modulation) right before it is applied, so only one block's
+            (gamma, beta) maps are alive at a time. Blocks whose level is None, and
+            every block when seg is not one-hot or the norm convs are quantized
+            (None is returned), run the convs on seg.
+        """
+        labels = seg.argmax(dim=1)
+        if not torch.equal(F.one_hot(labels, seg.size(1)).permute(0, 3, 1, 2).to(seg.dtype), seg):
+            return None
+        pyramid, levels = {}, {}
+        h, w = size or seg.size()[2:]
+        for name, block_size in self.block_sizes(h, w):
+            for _, norm in self._modules[name].norms():
+                if any(type(conv) is not nn.Conv2d for conv in [norm.conv_shared[0], norm.conv_gamma, norm.conv_beta]):
+                    return None
+            if block_size not in levels:
+                level_labels = F.interpolate(labels[:, None].float(), size=block_size, mode='nearest')[:, 0].long()
+                level = label_windows(level_labels, seg.size(1))
+                # at the coarse resolutions almost every window is distinct, the convs are cheaper there
+                levels[block_size] = level if level['patterns'].size(0) * 4 < level_labels.numel() else None
+            pyramid[name] = levels[block_size]
+        return pyramid
+
+    def forward(self, x, seg, pyramid=None):
+        # the latent size follows the input, so the same weights render any rung of the resolution
+        # ladder; sizes that are not a multiple of the latent scale are rounded up
+        h, w = x.size()[2:]
+        scale = self.latent_scale()
+        sh, sw = -(-h // scale), -(-w // scale)
+        if pyramid is None and self.seg_pyramid and not (torch.jit.is_tracing() or torch.compiler.is_compiling()):
+            pyramid = self.label_pyramid(seg, (h, w))
+        pyramid = pyramid or {}
+        samples = [F.interpolate(x, size=(sh * 2**i, sw * 2**i), mode='nearest') for i in range(8)]
+        features = [self._modules['conv_{}'.format(i)](samples[i]) for i in range(8)]
+
+        x = self.head_0(features[0], seg, level=pyramid.get('head_0'))
+        x = self.up(x)
+        x = self.G_middle_0(torch.cat((x, features[1]), 1), seg, level=pyramid.get('G_middle_0'))
+        if self.num_upsampling_layers in ['more', 'most']:
+            x = self.up(x)
+        x = self.G_middle_1(torch.cat((x, features[2]), 1), seg, level=pyramid.get('G_middle_1'))
+
+        x = self.up(x)
+        x = self.up_0(torch.cat((x, features[3]), 1), seg, level=pyramid.get('up_0'))
+        x = self.up(x)
+        x = self.up_1(torch.cat((x, features[4]), 1), seg, level=pyramid.get('up_1'))
+        x = self.up(x)
+        x = self.up_2(torch.cat((x, features[5]), 1), seg, level=pyramid.get('up_2'))
+        x = self.up(x)
+        x = self.up_3(torch.cat((x, features[6]), 1), seg, level=pyramid.get('up_3'))
+        if self.num_upsampling_layers == 'most':
+            x = self.up(x)
+            x = self.up_4(torch.cat((x, features[7]), 1), seg, level=pyramid.get('up_4'))
+
+        x = self.conv_img(self.relu(x))
+        # an identity at multiples of the latent scale; unconditional so traced graphs stay size-generic
+        return F.interpolate(self.tanh(x), size=(h, w), mode='bilinear')
+########################################################################
+
+########################################################################
+    
+class NLayerDiscriminator(BaseNetwork):
+
+    def __init__(self, opt):
+        super().__init__()
+        self.no_ganFeat_loss = opt.no_ganFeat_loss
+        nf = opt.ndf
+
+        kw = 4
+        pw = int(np.ceil((kw - 1.0) / 2))
+        norm_layer = get_nonspade_norm_layer(opt.norm_D)
+
+        input_nc = opt.gen_semantic_nc + 3
+        # input_nc = opt.gen_semantic_nc + 13
+        sequence = [[nn.Conv2d(input_nc, nf, kernel_size=kw, stride=2, padding=pw),
+                     nn.LeakyReLU(0.2, False)]]
+
+        for n in range(1, opt.n_layers_D):
+            nf_prev = nf
+            nf = min(nf * 2, 512)
+            sequence += [[norm_layer(nn.Conv2d(nf_prev, nf, kernel_size=kw, stride=2, padding=pw)),
+                          nn.LeakyReLU(0.2, False)]]
+
+        sequence += [[nn.Conv2d(nf, 1, kernel_size=kw, stride=1, padding=pw)]]
+
+        # We divide the layers into groups to extract intermediate layer outputs
+        for n in range(len(sequence)):
+            self.add_module('model' + str(n), nn.Sequential(*sequence[n]))
+
+    def forward(self, input):
+        results = [input]
+        for submodel in self.children():
+            intermediate_output = submodel(results[-1])
+            results.append(intermediate_output)
+
+        get_intermediate_features = not self.no_ganFeat_loss
+        if get_intermediate_features:
+            return results[1:]
+        else:
+            return results[-1]
+
+
+class MultiscaleDiscriminator(BaseNetwork):
+
+    def __init__(self, opt):
+        super().__init__()
+        self.no_ganFeat_loss = opt.no_ganFeat_loss
+
+        for i in range(opt.num_D):
+            subnetD = NLayerDiscriminator(opt)
+            self.add_module('discriminator_%d' % i, subnetD)
+
+    def downsample(self, input):
+        return F.avg_pool2d(input, kernel_size=3, stride=2, padding=[1, 1], count_include_pad=False)
+
+    # Returns list of lists of discriminator outputs.
+    # The final result is of size opt.num_D x opt.n_layers_D
+    def forward(self, input):
+        result = []
+        get_intermediate_features = not self.no_ganFeat_loss
+        for name, D in self.named_children():
+            out = D(input)
+            if not get_intermediate_features:
+                out = [out]
+            result.append(out)
+            input = self.downsample(input)
+
+        return result
+    
+class GANLoss(nn.Module):
+    def __init__(self, gan_mode, target_real_label=1.0, target_fake_label=0.0, tensor=torch.FloatTensor):
+        super(GANLoss, self).__init__()
+        self.real_label = target_real_label
+        self.fake_label = target_fake_label
+        self.real_label_tensor = None
+        self.fake_label_tensor = None
+        self.zero_tensor = None
+        self.Tensor = tensor
+        self.gan_mode = gan_mode
+        if gan_mode == 'ls':
+            pass
+        elif gan_mode == 'original':
+            pass
+        elif gan_mode == 'w':
+            pass
+        elif gan_mode == 'hinge':
+            pass
+        else:
+            raise ValueError('Unexpected gan_mode {}'.format(gan_mode))
+
+    def get_target_tensor(self, input, target_is_real):
+        if target_is_real:
+            if self.real_label_tensor is None:
+                self.real_label_tensor = self.Tensor(1).fill_(self.real_label)
+                self.real_label_tensor.requires_grad_(False)
+            return self.real_label_tensor.expand_as(input)
+        else:
+            if self.fake_label_tensor is None:
+                self.fake_label_tensor = self.Tensor(1).fill_(self.fake_label)
+                self.fake_label_tensor.requires_grad_(False)
+            return self.fake_label_tensor.expand_as(input)
+
+    def get_zero_tensor(self, input):
+        if self.zero_tensor is None:
+            self.zero_tensor = self.Tensor(1).fill_(0)
+            self.zero_tensor.requires_grad_(False)
+        return self.zero_tensor.expand_as(input)
+
+    def loss(self, input, target_is_real, for_discriminator=True):
+        if self.gan_mode == 'original':  # cross entropy loss
+            target_tensor = self.get_target_tensor(input, target_is_real)
+            loss = F.binary_cross_entropy_with_logits(input, target_tensor)
+            return loss
+        elif self.gan_mode == 'ls':
+            target_tensor = self.get_target_tensor(input, target_is_real)
+            return F.mse_loss(input, target_tensor)
+        elif self.gan_mode == 'hinge':
+            if for_discriminator:
+                if target_is_real:
+                    minval = torch.min(input - 1, self.get_zero_tensor(input))
+                    loss = -torch.mean(minval)
+                else:
+                    minval = torch.min(-input - 1, self.get_zero_tensor(input))
+                    loss = -torch.mean(minval)
+            else:
+                assert target_is_real, "The generator's hinge loss must be aiming for real"
+                loss = -torch.mean(input)
+            return loss
+        else:
+            # wgan
+            if target_is_real:
+                return -input.mean()
+            else:
+                return input.mean()
+
+    def __call__(self, input, target_is_real, for_discriminator=True):
+        # computing loss is a bit complicated because |input| may not be
+        # a tensor, but list of tensors in case of multiscale discriminator
+        if isinstance(input, list):
+            loss = 0
+            for pred_i in input:
+                if isinstance(pred_i, list):
+                    pred_i = pred_i[-1]
+                loss_tensor = self.loss(pred_i, target_is_real, for_discriminator)
+                bs = 1 if len(loss_tensor.size()) == 0 else loss_tensor.size(0)
+                new_loss = torch.mean(loss_tensor.view(bs, -1), dim=1)
+                loss += new_loss
+            return loss / len(input)
+        else:
+            return self.loss(input, target_is_real, for_discriminator)
+
+
+def get_nonspade_norm_layer(norm_type='instance'):
+    def get_out_channel(layer):
+        if hasattr(layer, 'out_channels'):
+            return getattr(layer, 'out_channels')
+        return layer.weight.size(0)
+
+    def add_norm_layer(layer):
+        nonlocal norm_type
+        if norm_type.startswith('spectral'):
+            layer = spectral_norm(layer)
+            subnorm_type = norm_type[len('spectral'):]
+
+        if subnorm_type == 'none' or len(subnorm_type) == 0:
+            return layer
+
+        # remove bias in the previous layer, which is meaningless
+        # since it has no effect after normalization
+        if getattr(layer, 'bias', None) is not None:
+            delattr(layer, 'bias')
+            layer.register_parameter('bias', None)
+
+        if subnorm_type == 'batch':
+            norm_layer = nn.BatchNorm2d(get_out_channel(layer), affine=True)
+        # elif subnorm_type == 'sync_batch':
+        #     norm_layer = SynchronizedBatchNorm2d(get_out_channel(layer), affine=True)
+        elif subnorm_type == 'instance':
+            norm_layer = nn.InstanceNorm2d(get_out_channel(layer), affine=False)
+        else:
+            raise ValueError('normalization layer %s is not recognized' % subnorm_type)
+
+        return nn.Sequential(layer, norm_layer)
+
+    return add_norm_layer
+
+
+
+class ResBlock(nn.Module):
+    def __init__(self, in_nc, out_nc, scale='down', norm_layer=nn.BatchNorm2d):
+        super(ResBlock, self).__init__()
+        use_bias = norm_layer == nn.InstanceNorm2d
+        assert scale in ['up', 'down', 'same'], "ResBlock scale must be in 'up' 'down' 'same'"
+
+        if scale == 'same':
+            self.scale = nn.Conv2d(in_nc, out_nc, kernel_size=1, bias=True)
+        if scale == 'up':
+            self.scale = nn.Sequential(
+                nn.Upsample(scale_factor=2, mode='bilinear'),
+                nn.Conv2d(in_nc, out_nc, kernel_size=1, bias=True)
+            )
+        if scale == 'down':
+            self.scale = nn.Conv2d(in_nc, out_nc, kernel_size=3, stride=2, padding=1, bias=use_bias)
+
+        self.block = nn.Sequential(
+            nn.Conv2d(out_nc, out_nc, kernel_size=3, stride=1, padding=1, bias=use_bias),
+            norm_layer(out_nc),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(out_nc, out_nc, kernel_size=3, stride=1, padding=1, bias=use_bias),
+            norm_layer(out_nc)
+        )
+
+        self.attention = CBAM(out_nc)
+        self.relu = nn.ReLU(inplace=True)
+
+    def forward(self, x):
+        residual = self.scale(x)
+        out = self.block(residual)
+        out = self.attention(out)
+        return self.relu(residual + out)
@@ -0,0 +1,75 @@
+import os.path as osp
+
+import torch
+
+
+TOCG_CLOTH_NAME = 'tocg_cloth.onnx'
+TOCG_POSE_NAME = 'tocg_pose.onnx'
+TOCG_NAME = 'tocg.onnx'
+GEN_NAME = 'gen.onnx'
+
+
+class OnnxModel(object):
+    # ONNX Runtime session behind a torch-tensor interface
+    def __init__(self, path, opt):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if opt.num_threads > 0:
+            options.intra_op_num_threads = opt.num_threads
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if opt.cuda else ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(path, options, providers=providers)
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.metadata = self.session.get_modelmeta().custom_metadata_map
+        self.device = 'cuda' if opt.cuda else 'cpu'
+
+    def run(self, *inputs):
+        feed = {name: x.detach().cpu().float().contiguous().numpy() for name, x in zip(self.input_names, inputs)}
+        return [torch.from_numpy(y).to(self.device) for y in self.session.run(None, feed)]
+
+    def eval(self):
+        return self
+
+    def cuda(self):
+        return self
+
+
+class OnnxConditionGenerator(OnnxModel):
+    """
+        Drop-in replacement for a loaded ConditionGenerator in run_tryon and the
+        inference engine, backed by the graphs written by export_onnx. Only the
+        last flow of the flow pyramid is returned.
+    """
+    def __init__(self, onnx_dir, opt):
+        super(OnnxConditionGenerator, self).__init__(osp.join(onnx_dir, TOCG_NAME), opt)
+        self.cloth_encoder = OnnxModel(osp.join(onnx_dir, TOCG_CLOTH_NAME), opt)
+        self.pose_encoder = OnnxModel(osp.join(onnx_dir, TOCG_POSE_NAME), opt)
+
+    def encode_cloth(self, input1):
+        return self.cloth_encoder.run(input1)
+
+    def encode_pose(self, input2):
+        return self.pose_encoder.run(input2)
+
+    def __call__(self, opt, input1, input2, upsample='bilinear', E1_list=None, E2_list=None):
+        if E1_list is None:
+            E1_list = self.encode_cloth(input1)
+        if E2_list is None:
+            E2_list = self.encode_pose(input2)
+        flow, fake_segmap, warped_c, warped_cm = self.run(input1, input2, *(list(E1_list) + list(E2_list)))
+        return [flow], fake_segmap, warped_c, warped_cm
+
+
+class OnnxGenerator(OnnxModel):
+    # drop-in replacement for a loaded SPADEGenerator, `noise` is the SPADE noise mode baked into the graph
+    def __init__(self, onnx_dir, opt):
+        super(OnnxGenerator, self).__init__(osp.join(onnx_dir, GEN_NAME), opt)
+        # graphs exported before the mode was recorded
+        self.noise = self.metadata.get('noise', 'random')
+
+    def __call__(self, x, seg):
+        return self.run(x, seg)[0]
+
+
+def load_onnx_models(opt):
+    return OnnxConditionGenerator(opt.onnx_dir, opt), OnnxGenerator(opt.onnx_dir, opt)
@@ -0,0 +1,147 @@
+import copy
+import os
+import os.path as osp
+import sys
+import tempfile
+
+import onnx
+import torch
+import torch.nn as nn
+from torch.utils.data.dataloader import default_collate
+
+from cp_dataset_test import CPDatasetTest
+from cpu_inference import optimize_for_cpu
+from networks import GaussianBlur
+from onnx_backend import TOCG_CLOTH_NAME, TOCG_POSE_NAME, TOCG_NAME, GEN_NAME, OnnxConditionGenerator, OnnxGenerator
+from test_generator import get_opt, build_models, run_tryon
+
+
+OPSET = 16  # first opset with GridSample
+PYRAMID_NAMES = ['E1_%d' % i for i in range(5)] + ['E2_%d' % i for i in range(5)]
+TOCG_OUTPUT_NAMES = ['flow', 'fake_segmap', 'warped_cloth', 'warped_clothmask']
+TOLERANCE = 1e-3
+
+
+class TocgEncoder(nn.Module):
+    # one side of the condition generator feature pyramid, 'cloth' or 'pose'
+    def __init__(self, tocg, side):
+        super(TocgEncoder, self).__init__()
+        self.tocg = tocg
+        self.side = side
+
+    def forward(self, x):
+        if self.side == 'cloth':
+            return tuple(self.tocg.encode_cloth(x))
+        return tuple(self.tocg.encode_pose(x))
+
+
+class TocgDecoder(nn.Module):
+    # flow / segmentation decoder of the condition generator on precomputed pyramids
+    def __init__(self, tocg):
+        super(TocgDecoder, self).__init__()
+        self.tocg = tocg
+
+    def forward(self, input1, input2, *pyramids):
+        flow_list, fake_segmap, warped_c, warped_cm = self.tocg(None, input1, input2, E1_list=list(pyramids[:5]), E2_list=list(pyramids[5:]))
+        return flow_list[-1], fake_segmap, warped_c, warped_cm
+
+
+def export_graph(model, inputs, input_names, output_names, path, spatial=False):
+    # dynamic batch axis, plus dynamic height / width with `spatial`
+    axes = {0: 'batch', 2: 'height', 3: 'width'} if spatial else {0: 'batch'}
+    dynamic_axes = {name: axes for name in input_names + output_names}
+    with torch.no_grad():
+        torch.onnx.export(model, inputs, path, dynamo=False, opset_version=OPSET,
+                          input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes)
+
+
+def export_onnx(opt, tocg, generator, onnx_dir):
+    """
+        Writes the condition generator as three graphs (cloth encoder, pose encoder
+        and decoder, so the engine can keep caching the pyramids) and the SPADE
+        generator as one graph, all with a dynamic batch axis. The sampling grids
+        are frozen into the decoder as constants, so the condition graphs are tied
+        to 256x192; the generator graph takes any output resolution.
+    """
+    os.makedirs(onnx_dir, exist_ok=True)
+    tocg = optimize_for_cpu(copy.deepcopy(tocg).cpu(), channels_last=False)
+    tocg.freeze_grids(256, 192)
+
+    input1 = torch.zeros(1, tocg.ClothEncoder[0].scale.in_channels, 256, 192)
+    input2 = torch.zeros(1, tocg.PoseEncoder[0].scale.in_channels, 256, 192)
+    with torch.no_grad():
+        pyramids = tocg.encode_cloth(input1) + tocg.encode_pose(input2)
+    export_graph(TocgEncoder(tocg, 'cloth'), (input1,), ['input1'], PYRAMID_NAMES[:5], osp.join(onnx_dir, TOCG_CLOTH_NAME))
+    export_graph(TocgEncoder(tocg, 'pose'), (input2,), ['input2'], PYRAMID_NAMES[5:], osp.join(onnx_dir, TOCG_POSE_NAME))
+    export_graph(TocgDecoder(tocg), tuple([input1, input2] + pyramids), ['input1', 'input2'] + PYRAMID_NAMES,
+                 TOCG_OUTPUT_NAMES, osp.join(onnx_dir, TOCG_NAME))
+
+    export_generator(opt, generator, osp.join(onnx_dir, GEN_NAME), opt.noise)
+
+
+def export_generator(opt, generator, path, noise):
+    # `noise` is the generator's noise mode, recorded in the graph metadata for build_models
+    generator = optimize_for_cpu(copy.deepcopy(generator).cpu(), channels_last=False)
+    x = torch.zeros(1, generator.conv_0.in_channels, opt.fine_height, opt.fine_width)
+    seg = torch.zeros(1, opt.gen_semantic_nc, opt.fine_height, opt.fine_width)
+    export_graph(generator, (x, seg), ['x', 'seg'], ['output'], path, spatial=True)
+    model = onnx.load(path)
+    onnx.helper.set_model_props(model, {'noise': noise})
+    onnx.save(model, path)
+
+
+def without_noise(generator):
+    generator = copy.deepcopy(generator)
+    generator.set_noise('off')
+    return generator
+
+
+def check_parity(opt, tocg, generator, inputs):
+    """
+        Runs one collated batch through PyTorch and through the graphs in
+        opt.onnx_dir and returns the max abs difference of the warped cloth, the
+        blurred parse and the try-on output. ONNX Runtime draws the SPADE noise
+        from its own RNG, so the generator is compared on noise-free copies.
+    """
+    gauss = GaussianBlur((15, 15), (3, 3))
+    if opt.cuda:
+        gauss = gauss.cuda()
+    generator = without_noise(generator)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        export_generator(opt, generator, osp.join(tmp_dir, GEN_NAME), 'off')
+        onnx_tocg, onnx_generator = OnnxConditionGenerator(opt.onnx_dir, opt), OnnxGenerator(tmp_dir, opt)
+        with torch.inference_mode():
+            expected = run_tryon(opt, inputs, tocg, generator, gauss)
+            result = run_tryon(opt, inputs, onnx_tocg, onnx_generator, gauss)
+    return {key: (expected[key] - result[key]).abs().max().item() for key in ['warped_cloth', 'fake_parse_gauss', 'output']}
+
+
+def main():
+    """
+        Exports the checkpoints given by --tocg_checkpoint / --gen_checkpoint to
+        --onnx_dir and checks the ONNX Runtime outputs against PyTorch on the
+        first test pair, e.g.
+            python onnx_export.py --tocg_checkpoint ... --gen_checkpoint ... --onnx_dir ./onnx
+        With --noise off the generator graph has no SPADE noise and renders
+        reproducibly. The mode is recorded in the graph and --backend onnx runs
+        with it.
+    """
+    opt = get_opt()
+    assert opt.noise != 'fixed', "the graphs are size-generic, export with --noise random or off"
+    opt.backend, opt.cpu_fast, opt.precision, opt.seg_pyramid = 'torch', False, 'fp32', False
+    dataset = CPDatasetTest(opt)
+    tocg, generator = build_models(opt)
+    tocg.eval()
+    generator.eval()
+    export_onnx(opt, tocg, generator, opt.onnx_dir)
+
+    diffs = check_parity(opt, tocg, generator, default_collate([dataset[0]]))
+    for key, diff in diffs.items():
+        print("max abs diff %-16s %.2e" % (key, diff))
+    if max(diffs.values()) > TOLERANCE:
+        print("ONNX Runtime outputs differ from PyTorch by more than %g" % TOLERANCE)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
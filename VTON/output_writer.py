@@ -0,0 +1,86 @@
+import os
+import queue
+import threading
+
+import numpy as np
+
+from utils import tensor_to_image
+
+
+OUTPUT_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'webp': 'WEBP', 'npy': None}
+
+
+def save_output(img_tensor, path, output_format='jpg'):
+    """
+        Writes one (3, H, W) output in [-1, 1] to `path` + the format's extension.
+        'npy' keeps the raw float32 tensor, the other formats go through
+        utils.tensor_to_image. The file is written under a temporary name and
+        renamed, so an interrupted run never leaves a truncated output behind.
+        Returns the written path.
+    """
+    path = path + '.' + output_format
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        if output_format == 'npy':
+            np.save(f, img_tensor.detach().cpu().float().numpy())
+        else:
+            tensor_to_image(img_tensor).save(f, format=OUTPUT_FORMATS[output_format])
+    os.replace(tmp_path, path)
+    return path
+
+
+class OutputWriter(object):
+    """
+        Background pool for encoding and writing results off the inference thread.
+
+        `num_workers` threads drain a queue of at most `max_pending` jobs; submit
+        blocks while the queue is full, so a slow disk throttles inference instead
+        of buffering every output in memory. Image encoding and the torch ops of
+        the visualization grids release the GIL, so threads are enough. The first
+        error raised by a job is re-raised by the next submit or by close.
+    """
+    def __init__(self, num_workers=2, max_pending=16):
+        super(OutputWriter, self).__init__()
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(num_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, fn, *args):
+        # args must not be modified by the caller afterwards, pass CPU copies of device tensors
+        self.check()
+        self.queue.put((fn, args))
+
+    def save(self, img_tensor, path, output_format='jpg'):
+        self.submit(save_output, img_tensor, path, output_format)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        # waits for the pending jobs
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import os.path as osp
+
+import numpy as np
+import torch
+import torch.utils.data as data
+import torchvision.transforms as transforms
+from PIL import Image
+from tqdm import tqdm
+
+from agnostic import get_agnostic_batch
+from keypoint_table import KeypointTable
+from parse_labels import parse_lut, label_onehot
+
+
+# arrays indexed by person row and by cloth row
+PERSON_ARRAYS = ['image', 'parse', 'parse_agnostic', 'pose', 'densepose', 'agnostic', 'keypoints']
+CLOTH_ARRAYS = ['cloth', 'cloth_mask']
+
+
+def read_pairs(path):
+    im_names = []
+    c_names = []
+    with open(path, 'r') as f:
+        for line in f.readlines():
+            if not line.strip():
+                continue
+            im_name, c_name = line.strip().split()
+            im_names.append(im_name)
+            c_names.append(c_name)
+    return im_names, c_names
+
+
+def unique(names):
+    return list(dict.fromkeys(names))
+
+
+def build_packed_dataset(opt, output_dir):
+    """
+        Decodes, resizes and label-remaps every person and cloth referenced by
+        `opt.data_list` once and writes them as uint8 .npy arrays under `output_dir`,
+        together with an `index.json` mapping names and pairs to rows.
+        Agnostic images are rasterized `opt.batch_size` persons at a time, so the
+        full-size person images of a split must share one resolution.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    data_path = osp.join(opt.dataroot, opt.datamode)
+    h, w = opt.fine_height, opt.fine_width
+    resize_bilinear = transforms.Resize(w, interpolation=2)
+    resize_nearest = transforms.Resize(w, interpolation=0)
+
+    im_names, c_names = read_pairs(osp.join(opt.dataroot, opt.data_list))
+    persons = unique(im_names)
+    cloths = unique(im_names + c_names)
+    person_row = {name: i for i, name in enumerate(persons)}
+    cloth_row = {name: i for i, name in enumerate(cloths)}
+
+    def open_array(name, rows, shape, dtype=np.uint8):
+        return np.lib.format.open_memmap(osp.join(output_dir, name + '.npy'), mode='w+', dtype=dtype, shape=(rows,) + shape)
+
+    arrays = {
+        'image': open_array('image', len(persons), (h, w, 3)),
+        'parse': open_array('parse', len(persons), (h, w)),
+        'parse_agnostic': open_array('parse_agnostic', len(persons), (h, w)),
+        'pose': open_array('pose', len(persons), (h, w, 3)),
+        'densepose': open_array('densepose', len(persons), (h, w, 3)),
+        'agnostic': open_array('agnostic', len(persons), (h, w, 3)),
+        'keypoints': open_array('keypoints', len(persons), (25, 2), dtype=np.float32),
+        'cloth': open_array('cloth', len(cloths), (h, w, 3)),
+        'cloth_mask': open_array('cloth_mask', len(cloths), (h, w)),
+    }
+
+    def write_agnostic(rows, images, parses, poses):
+        agnostic = get_agnostic_batch(torch.stack(images), torch.stack(parses), torch.stack(poses))
+        for row, im in zip(rows, agnostic.numpy()):
+            arrays['agnostic'][row] = np.array(resize_bilinear(Image.fromarray(im)))
+
+    keypoints = KeypointTable(data_path)
+    batch = ([], [], [], [])
+    for i, im_name in enumerate(tqdm(persons, desc='persons')):
+        parse_name = im_name.replace('.jpg', '.png')
+        im_pil_big = Image.open(osp.join(data_path, 'image', im_name))
+        im_parse_pil_big = Image.open(osp.join(data_path, 'image-parse-v3', parse_name))
+        parse_agnostic = Image.open(osp.join(data_path, 'image-parse-agnostic-v3.2', parse_name))
+        pose_map = Image.open(osp.join(data_path, 'openpose_img', im_name.replace('.jpg', '_rendered.png')))
+        densepose_map = Image.open(osp.join(data_path, 'image-densepose', im_name))
+        pose_data = keypoints[im_name]
+
+        arrays['keypoints'][i] = pose_data
+        arrays['image'][i] = np.array(resize_bilinear(im_pil_big.convert('RGB')))
+        arrays['parse'][i] = parse_lut[np.array(resize_nearest(im_parse_pil_big))]
+        arrays['parse_agnostic'][i] = parse_lut[np.array(resize_nearest(parse_agnostic))]
+        arrays['pose'][i] = np.array(resize_bilinear(pose_map.convert('RGB')))
+        arrays['densepose'][i] = np.array(resize_bilinear(densepose_map.convert('RGB')))
+
+        for items, item in zip(batch, [i, torch.from_numpy(np.array(im_pil_big.convert('RGB'))),
+                                       torch.from_numpy(np.array(im_parse_pil_big)), torch.from_numpy(pose_data).float()]):
+            items.append(item)
+        if len(batch[0]) == opt.batch_size or i == len(persons) - 1:
+            write_agnostic(*batch)
+            batch = ([], [], [], [])
+
+    for i, c_name in enumerate(tqdm(cloths, desc='cloths')):
+        c = Image.open(osp.join(data_path, 'cloth', c_name)).convert('RGB')
+        cm = Image.open(osp.join(data_path, 'cloth-mask', c_name))
+        arrays['cloth'][i] = np.array(resize_bilinear(c))
+        arrays['cloth_mask'][i] = np.array(resize_nearest(cm)) >= 128
+
+    for array in arrays.values():
+        array.flush()
+
+    index = {
+        'fine_height': h,
+        'fine_width': w,
+        'persons': persons,
+        'cloths': cloths,
+        'pairs': [[person_row[im_name], cloth_row[im_name], cloth_row[c_name]] for im_name, c_name in zip(im_names, c_names)],
+    }
+    with open(osp.join(output_dir, 'index.json'), 'w') as f:
+        json.dump(index, f)
+
+
+class PackedDataset(data.Dataset):
+    """
+        Dataset reading the arrays written by build_packed_dataset.
+
+        The .npy files are memory-mapped, so a sample only touches the rows it
+        needs; the returned dict has the same keys as CPDatasetTest.
+    """
+    def __init__(self, opt):
+        super(PackedDataset, self).__init__()
+        self.opt = opt
+        self.root = opt.packed_dir
+        self.semantic_nc = opt.semantic_nc
+        with open(osp.join(self.root, 'index.json'), 'r') as f:
+            index = json.load(f)
+        assert (index['fine_height'], index['fine_width']) == (opt.fine_height, opt.fine_width), \
+            "packed store was built for %dx%d" % (index['fine_height'], index['fine_width'])
+        self.persons = index['persons']
+        self.cloths = index['cloths']
+        self.pairs = index['pairs']
+        self.im_names = [self.persons[p] for p, _, _ in self.pairs]
+
+        # copy-on-write maps keep the arrays writable for torch.from_numpy without touching the files
+        self.arrays = {}
+        for name in PERSON_ARRAYS + CLOTH_ARRAYS:
+            self.arrays[name] = np.load(osp.join(self.root, name + '.npy'), mmap_mode='c')
+
+    def name(self):
+        return "PackedDataset"
+
+    def image(self, name, row):
+        # uint8 HxWx3 -> float CxHxW in [-1, 1]
+        x = torch.from_numpy(self.arrays[name][row]).permute(2, 0, 1).float()
+        return x / 127.5 - 1
+
+    def onehot(self, name, row):
+        label = torch.from_numpy(self.arrays[name][row]).long()[None]
+        return label_onehot(label, self.semantic_nc), label
+
+    def __getitem__(self, index):
+        p, cp, cu = self.pairs[index]
+        im_name = self.persons[p]
+        c_name = {'paired': self.cloths[cp], 'unpaired': self.cloths[cu]}
+        c = {'paired': self.image('cloth', cp), 'unpaired': self.image('cloth', cu)}
+        cm = {'paired': torch.from_numpy(self.arrays['cloth_mask'][cp]).float()[None],
+              'unpaired': torch.from_numpy(self.arrays['cloth_mask'][cu]).float()[None]}
+
+        im = self.image('image', p)
+        new_parse_map, parse = self.onehot('parse', p)
+        new_parse_agnostic_map, _ = self.onehot('parse_agnostic', p)
+        parse_onehot = parse.float()
+
+        # parse cloth & parse cloth mask
+        pcm = new_parse_map[3:4]
+        im_c = im * pcm + (1 - pcm)
+
+        result = {
+            'c_name':   c_name,     # for visualization
+            'im_name':  im_name,    # for visualization or ground truth
+            # intput 1 (clothfloww)
+            'cloth':    c,          # for input
+            'cloth_mask':     cm,   # for input
+            # intput 2 (segnet)
+            'parse_agnostic': new_parse_agnostic_map,
+            'densepose': self.image('densepose', p),
+            'pose': self.image('pose', p),       # for conditioning
+            # generator input
+            'agnostic' : self.image('agnostic', p),
+            # GT
+            'parse_onehot' : parse_onehot,  # Cross Entropy
+            'parse': new_parse_map, # GAN Loss real
+            'pcm': pcm,             # L1 Loss & vis
+            'parse_cloth': im_c,    # VGG Loss & vis
+            # visualization
+            'image':    im,         # for visualization
+            }
+        return result
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataroot", default="./data/zalando-hd-resize")
+    parser.add_argument("--datamode", default="test")
+    parser.add_argument("--data_list", default="test_pairs.txt")
+    parser.add_argument("--output_dir", type=str, help="packed store dir")
+    parser.add_argument("--fine_width", type=int, default=768)
+    parser.add_argument("--fine_height", type=int, default=1024)
+    parser.add_argument("--semantic_nc", type=int, default=13)
+    parser.add_argument("-b", "--batch_size", type=int, default=8, help="persons per agnostic rasterization batch")
+
+    opt = parser.parse_args()
+    build_packed_dataset(opt, opt.output_dir)
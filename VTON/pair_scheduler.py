@@ -0,0 +1,75 @@
+import itertools
+from collections import OrderedDict
+
+
+GROUP_BY = ['none', 'person', 'cloth', 'auto']
+SIDES = {'person': 0, 'cloth': 1}
+
+
+def resolve_group_by(pairs, group_by):
+    """
+        'auto' groups by the side with more distinct names: each group then
+        builds its own features once, and the side with fewer names cycles in
+        the same order through every group, where the LRU cache can hold it.
+    """
+    if group_by != 'auto':
+        return group_by
+    persons = set(im_name for im_name, _ in pairs)
+    cloths = set(c_name for _, c_name in pairs)
+    return 'cloth' if len(cloths) > len(persons) else 'person'
+
+
+def group_pairs(pairs, group_by='auto'):
+    """
+        Splits (person, cloth) pairs into groups sharing the person or the cloth.
+        Groups are ordered by their first pair and keep the list order inside,
+        'none' returns one group per pair.
+    """
+    pairs = list(pairs)
+    group_by = resolve_group_by(pairs, group_by)
+    if group_by == 'none':
+        return [[pair] for pair in pairs]
+    groups = OrderedDict()
+    for pair in pairs:
+        groups.setdefault(pair[SIDES[group_by]], []).append(pair)
+    return list(groups.values())
+
+
+def shard_pairs(groups, rank, num_shards):
+    # whole groups are dealt round-robin, so a group never spans two model replicas
+    return list(itertools.chain.from_iterable(groups[rank::num_shards]))
+
+
+def count_loads(pairs, side, cache_size):
+    # decodes / encoder passes of one side for `pairs` in this order, behind an LRU cache of `cache_size` entries
+    if cache_size <= 0:
+        return len(pairs)
+    cache = OrderedDict()
+    loads = 0
+    for pair in pairs:
+        key = pair[SIDES[side]]
+        if key in cache:
+            cache.move_to_end(key)
+            continue
+        loads += 1
+        cache[key] = None
+        if len(cache) > cache_size:
+            cache.popitem(last=False)
+    return loads
+
+
+def schedule_report(pairs, group_by, num_shards=1, person_cache_size=16, garment_cache_size=64):
+    """
+        Person and garment loads (a decode plus an encoder pass each) over
+        `num_shards` replicas, as (file order, grouped order) counts under the
+        'person' and 'cloth' keys, e.g. for 10 models x 1000 garments listed
+        model by model, grouped by cloth: 'person': (10, 10), 'cloth': (10000, 1000).
+    """
+    pairs = list(pairs)
+    groups = group_pairs(pairs, group_by)
+    report = {'pairs': len(pairs), 'group_by': resolve_group_by(pairs, group_by)}
+    for side, cache_size in [('person', person_cache_size), ('cloth', garment_cache_size)]:
+        file_order = sum(count_loads(pairs[rank::num_shards], side, cache_size) for rank in range(num_shards))
+        grouped = sum(count_loads(shard_pairs(groups, rank, num_shards), side, cache_size) for rank in range(num_shards))
+        report[side] = (file_order, grouped)
+    return report
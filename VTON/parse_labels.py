@@ -0,0 +1,46 @@
+import numpy as np
+import torch
+
+
+# image-parse-v3 label -> 13-class label used by the networks
+labels = {
+    0:  ['background',  [0, 10]],
+    1:  ['hair',        [1, 2]],
+    2:  ['face',        [4, 13]],
+    3:  ['upper',       [5, 6, 7]],
+    4:  ['bottom',      [9, 12]],
+    5:  ['left_arm',    [14]],
+    6:  ['right_arm',   [15]],
+    7:  ['left_leg',    [16]],
+    8:  ['right_leg',   [17]],
+    9:  ['left_shoe',   [18]],
+    10: ['right_shoe',  [19]],
+    11: ['socks',       [8]],
+    12: ['noise',       [3, 11]]
+}
+
+# 13-class label -> 7-class parse of the SPADE generator
+gen_labels = {
+    0:  ['background',  [0]],
+    1:  ['paste',       [2, 4, 7, 8, 9, 10, 11]],
+    2:  ['upper',       [3]],
+    3:  ['hair',        [1]],
+    4:  ['left_arm',    [5]],
+    5:  ['right_arm',   [6]],
+    6:  ['noise',       [12]]
+}
+
+parse_lut = np.zeros(256, dtype=np.uint8)
+for i in range(len(labels)):
+    for label in labels[i][1]:
+        parse_lut[label] = i
+
+
+def remap_parse(im_parse):
+    # PIL / uint8 label image -> (1, H, W) long tensor of 13-class labels
+    return torch.from_numpy(parse_lut[np.asarray(im_parse)][None]).long()
+
+
+def label_onehot(label, semantic_nc):
+    # (1, H, W) long labels -> (semantic_nc, H, W) float one-hot map
+    return torch.zeros(semantic_nc, label.size(1), label.size(2)).scatter_(0, label, 1.0)
@@ -0,0 +1,71 @@
+import contextlib
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import QuantStub, DeQuantStub, get_default_qconfig, prepare, convert
+
+from cpu_inference import remove_spectral_norms, fuse_conv_bn
+
+
+def autocast(opt):
+    # bf16 autocast around the network forwards, a no-op for the other precisions
+    if opt.precision != 'bf16':
+        return contextlib.nullcontext()
+    return torch.autocast('cuda' if opt.cuda else 'cpu', dtype=torch.bfloat16)
+
+
+def to_float(value):
+    # casts the (nested) outputs of an autocast region back to fp32
+    if torch.is_tensor(value):
+        return value.float() if value.is_floating_point() else value
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_float(v) for v in value)
+    return value
+
+
+class QuantizedConv(nn.Module):
+    """
+        Conv2d with int8 weights and activations; the input is quantized with
+        the calibrated scale and the output is dequantized, so the layer drops
+        into an otherwise fp32 network.
+    """
+    def __init__(self, conv):
+        super(QuantizedConv, self).__init__()
+        self.quant = QuantStub()
+        self.conv = conv
+        self.dequant = DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.conv(self.quant(x)))
+
+
+def wrap_convs(model, qconfig):
+    # only the wrapped convs get a qconfig, norms and activations stay fp32
+    for name, child in model.named_children():
+        if isinstance(child, nn.Conv2d):
+            wrapped = QuantizedConv(child)
+            wrapped.qconfig = qconfig
+            setattr(model, name, wrapped)
+        else:
+            wrap_convs(child, qconfig)
+    return model
+
+
+def prepare_int8(model, backend='x86'):
+    """
+        Inserts observers for static post-training int8 quantization of every
+        Conv2d (per-channel weights, per-tensor activations). Run calibration
+        batches through the model, then call convert_int8.
+    """
+    model.eval()
+    remove_spectral_norms(model)
+    fuse_conv_bn(model)
+    torch.backends.quantized.engine = backend
+    wrap_convs(model, get_default_qconfig(backend))
+    prepare(model, inplace=True)
+    return model
+
+
+def convert_int8(model):
+    convert(model, inplace=True)
+    return model
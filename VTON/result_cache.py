@@ -0,0 +1,149 @@
+import glob
+import hashlib
+import os
+import os.path as osp
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from feature_cache import file_digest
+
+
+CACHE_VERSION = 1
+# options that change the rendered output, part of every key
+RESULT_OPTIONS = ['fine_height', 'fine_width', 'cuda', 'backend', 'precision', 'cpu_fast', 'jit', 'seg_pyramid',
+                  'noise', 'noise_seed', 'occlusion', 'clothmask_composition', 'upsample', 'warp_feature', 'out_layer',
+                  'ngf', 'num_upsampling_layers', 'norm_G', 'gen_semantic_nc']
+
+
+def model_digest(opt):
+    """
+        Content hash of the networks an engine renders with: the checkpoint
+        bytes (the graphs in opt.onnx_dir with the ONNX backend) and the
+        RESULT_OPTIONS values. Hashing a full checkpoint takes about a second,
+        so it is computed once per engine.
+    """
+    if opt.backend == 'onnx':
+        paths = sorted(glob.glob(osp.join(opt.onnx_dir, '*')))
+    else:
+        paths = [opt.tocg_checkpoint, opt.gen_checkpoint]
+    options = [(name, getattr(opt, name, None)) for name in RESULT_OPTIONS]
+    return hashlib.sha1(('%d %s %r' % (CACHE_VERSION, file_digest(*paths), options)).encode()).hexdigest()
+
+
+def result_key(model_key, *input_keys):
+    # key of one try-on: the model digest and the digests of its inputs (person, garment + pattern)
+    return hashlib.sha1(' '.join((model_key,) + input_keys).encode()).hexdigest()
+
+
+class ResultCache(object):
+    """
+        On-disk store of full-resolution try-on outputs keyed by content
+        (see result_key), shared by every process pointed at `cache_dir`.
+
+        Each output is kept as a float32 .npy file, so a hit serves the exact
+        tensor the generator returned. The least recently used files are deleted
+        once the store grows past `max_bytes`; recency survives restarts through
+        the file modification times. Several processes may share a directory:
+        a file evicted by another process is a miss. With --noise random a hit
+        returns the noise drawn by the run that filled the entry.
+
+        Hits, misses and evictions are counted, along with the time a hit takes to
+        serve and the time from a miss to the put of its result.
+    """
+    def __init__(self, cache_dir, max_bytes=2 * 2**30):
+        super(ResultCache, self).__init__()
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = OrderedDict()  # key -> file size, least recently used first
+        files = []
+        for path in glob.glob(osp.join(cache_dir, '*', '*.npy')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self.entries[osp.basename(path)[:-len('.npy')]] = size
+        self.nbytes = sum(self.entries.values())
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hit_time = 0.0
+        self.miss_time = 0.0
+        self.computed = 0
+
+    def path(self, key):
+        return osp.join(self.cache_dir, key[:2], key + '.npy')
+
+    def get(self, key):
+        # the cached (3, H, W) output tensor, or None
+        start = time.perf_counter()
+        path = self.path(key)
+        try:
+            output = torch.from_numpy(np.load(path))
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+                self.pending[key] = start
+                self.nbytes -= self.entries.pop(key, 0)
+            return None
+        with self.lock:
+            if key not in self.entries:
+                # written by another process
+                self.entries[key] = os.path.getsize(path)
+                self.nbytes += self.entries[key]
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.hit_time += time.perf_counter() - start
+        return output
+
+    def put(self, key, output):
+        path = self.path(key)
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        # written under a temporary name so concurrent readers never load a partial file
+        tmp_path = path + '.tmp%d_%d' % (os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, output.detach().cpu().float().numpy())
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        with self.lock:
+            start = self.pending.pop(key, None)
+            if start is not None:
+                self.computed += 1
+                self.miss_time += time.perf_counter() - start
+            self.nbytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            evicted = []
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.nbytes -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def get_or_compute(self, key, compute):
+        output = self.get(key)
+        if output is None:
+            output = compute()
+            self.put(key, output)
+        return output
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / max(lookups, 1),
+                'hit_ms': self.hit_time * 1000 / max(self.hits, 1), 'miss_ms': self.miss_time * 1000 / max(self.computed, 1)}
@@ -1,280 +1,400 @@
-import torch
-import torch.nn as nn
-
-from torchvision.utils import make_grid as make_image_grid
-from torchvision.utils import save_image
-import argparse
-import os
-import time
-from cp_dataset_test import CPDatasetTest, CPDataLoader
-
-from networks import ConditionGenerator, load_checkpoint, make_grid
-from network_generator import SPADEGenerator
-from tensorboardX import SummaryWriter
-from utils import *
-
-import torchgeometry as tgm
-from collections import OrderedDict
-
-def remove_overlap(seg_out, warped_cm):
-    
-    assert len(warped_cm.shape) == 4
-    
-    warped_cm = warped_cm - (torch.cat([seg_out[:, 1:3, :, :], seg_out[:, 5:, :, :]], dim=1)).sum(dim=1, keepdim=True) * warped_cm
-    return warped_cm
-def get_opt():
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument("--gpu_ids", default="")
-    parser.add_argument('-j', '--workers', type=int, default=4)
-    parser.add_argument('-b', '--batch-size', type=int, default=1)
-    parser.add_argument('--fp16', action='store_true', help='use amp')
-    # Cuda availability
-    parser.add_argument('--cuda',default=False, help='cuda or cpu')
-
-    parser.add_argument('--test_name', type=str, default='test', help='test name')
-    parser.add_argument("--dataroot", default="./data/zalando-hd-resize")
-    parser.add_argument("--datamode", default="test")
-    parser.add_argument("--data_list", default="test_pairs.txt")
-    parser.add_argument("--output_dir", type=str, default="./Output")
-    parser.add_argument("--datasetting", default="unpaired")
-    parser.add_argument("--fine_width", type=int, default=768)
-    parser.add_argument("--fine_height", type=int, default=1024)
-
-    parser.add_argument('--tensorboard_dir', type=str, default='./data/zalando-hd-resize/tensorboard', help='save tensorboard infos')
-    parser.add_argument('--checkpoint_dir', type=str, default='checkpoints', help='save checkpoint infos')
-    parser.add_argument('--tocg_checkpoint', type=str, default='./eval_models/weights/v0.1/mtviton.pth', help='tocg checkpoint')
-    parser.add_argument('--gen_checkpoint', type=str, default='./eval_models/weights/v0.1/gen.pth', help='G checkpoint')
-
-    parser.add_argument("--tensorboard_count", type=int, default=100)
-    parser.add_argument("--shuffle", action='store_true', help='shuffle input data')
-    parser.add_argument("--semantic_nc", type=int, default=13)
-    parser.add_argument("--output_nc", type=int, default=13)
-    parser.add_argument('--gen_semantic_nc', type=int, default=7, help='# of input label classes without unknown class')
-    
-    # network
-    parser.add_argument("--warp_feature", choices=['encoder', 'T1'], default="T1")
-    parser.add_argument("--out_layer", choices=['relu', 'conv'], default="relu")
-    
-    # training
-    parser.add_argument("--clothmask_composition", type=str, choices=['no_composition', 'detach', 'warp_grad'], default='warp_grad')
-        
-    # Hyper-parameters
-    parser.add_argument('--upsample', type=str, default='bilinear', choices=['nearest', 'bilinear'])
-    parser.add_argument('--occlusion', action='store_true', help="Occlusion handling")
-
-    # generator
-    parser.add_argument('--norm_G', type=str, default='spectralaliasinstance', help='instance normalization or batch normalization')
-    parser.add_argument('--ngf', type=int, default=64, help='# of gen filters in first conv layer')
-    parser.add_argument('--init_type', type=str, default='xavier', help='network initialization [normal|xavier|kaiming|orthogonal]')
-    parser.add_argument('--init_variance', type=float, default=0.02, help='variance of the initialization distribution')
-    parser.add_argument('--num_upsampling_layers', choices=('normal', 'more', 'most'), default='most', # normal: 256, more: 512
-                        help="If 'more', adds upsampling layer between the two middle resnet blocks. If 'most', also add one more upsampling + resnet layer at the end of the generator")
-
-    opt = parser.parse_args()
-    # Ensure opt.cuda is a boolean
-    opt.cuda = (opt.cuda == True or str(opt.cuda).lower() == 'true')
-    return opt
-
-def load_checkpoint_G(model, checkpoint_path,opt):
-    if not os.path.exists(checkpoint_path):
-        print("Invalid path!")
-        return
-    state_dict = torch.load(checkpoint_path)
-    new_state_dict = OrderedDict([(k.replace('ace', 'alias').replace('.Spade', ''), v) for (k, v) in state_dict.items()])
-    new_state_dict._metadata = OrderedDict([(k.replace('ace', 'alias').replace('.Spade', ''), v) for (k, v) in state_dict._metadata.items()])
-    model.load_state_dict(new_state_dict, strict=True)
-    if opt.cuda :
-        model.cuda()
-
-
-
-def test(opt, test_loader, tocg, generator):
-    gauss = tgm.image.GaussianBlur((15, 15), (3, 3))
-    if opt.cuda:
-        gauss = gauss.cuda()
-    
-    # Model
-    if opt.cuda :
-        tocg.cuda()
-    tocg.eval()
-    generator.eval()
-    
-    if opt.output_dir is not None:
-        output_dir = opt.output_dir
-    else:
-        output_dir = os.path.join('./output', opt.test_name,
-                            opt.datamode, opt.datasetting, 'generator', 'output')
-    grid_dir = os.path.join('./output', opt.test_name,
-                             opt.datamode, opt.datasetting, 'generator', 'grid')
-    
-    os.makedirs(grid_dir, exist_ok=True)
-    
-    os.makedirs(output_dir, exist_ok=True)
-    
-    num = 0
-    iter_start_time = time.time()
-    with torch.no_grad():
-        for inputs in test_loader.data_loader:
-
-            if opt.cuda :
-                pose_map = inputs['pose'].cuda()
-                pre_clothes_mask = inputs['cloth_mask'][opt.datasetting].cuda()
-                label = inputs['parse']
-                parse_agnostic = inputs['parse_agnostic']
-                agnostic = inputs['agnostic'].cuda()
-                clothes = inputs['cloth'][opt.datasetting].cuda() # target cloth
-                densepose = inputs['densepose'].cuda()
-                im = inputs['image']
-                input_label, input_parse_agnostic = label.cuda(), parse_agnostic.cuda()
-                pre_clothes_mask = torch.FloatTensor((pre_clothes_mask.detach().cpu().numpy() > 0.5).astype(float)).cuda()
-            else :
-                pose_map = inputs['pose']
-                pre_clothes_mask = inputs['cloth_mask'][opt.datasetting]
-                label = inputs['parse']
-                parse_agnostic = inputs['parse_agnostic']
-                agnostic = inputs['agnostic']
-                clothes = inputs['cloth'][opt.datasetting] # target cloth
-                densepose = inputs['densepose']
-                im = inputs['image']
-                input_label, input_parse_agnostic = label, parse_agnostic
-                pre_clothes_mask = torch.FloatTensor((pre_clothes_mask.detach().cpu().numpy() > 0.5).astype(float))
-
-
-
-            # down
-            pose_map_down = F.interpolate(pose_map, size=(256, 192), mode='bilinear')
-            pre_clothes_mask_down = F.interpolate(pre_clothes_mask, size=(256, 192), mode='nearest')
-            input_label_down = F.interpolate(input_label, size=(256, 192), mode='bilinear')
-            input_parse_agnostic_down = F.interpolate(input_parse_agnostic, size=(256, 192), mode='nearest')
-            agnostic_down = F.interpolate(agnostic, size=(256, 192), mode='nearest')
-            clothes_down = F.interpolate(clothes, size=(256, 192), mode='bilinear')
-            densepose_down = F.interpolate(densepose, size=(256, 192), mode='bilinear')
-
-            shape = pre_clothes_mask.shape
-            
-            # multi-task inputs
-            input1 = torch.cat([clothes_down, pre_clothes_mask_down], 1)
-            input2 = torch.cat([input_parse_agnostic_down, densepose_down], 1)
-
-            # forward
-            flow_list, fake_segmap, warped_cloth_paired, warped_clothmask_paired = tocg(opt,input1, input2)
-            
-            # warped cloth mask one hot
-            if opt.cuda :
-                warped_cm_onehot = torch.FloatTensor((warped_clothmask_paired.detach().cpu().numpy() > 0.5).astype(float)).cuda()
-            else :
-                warped_cm_onehot = torch.FloatTensor((warped_clothmask_paired.detach().cpu().numpy() > 0.5).astype(float))
-
-            if opt.clothmask_composition != 'no_composition':
-                if opt.clothmask_composition == 'detach':
-                    cloth_mask = torch.ones_like(fake_segmap)
-                    cloth_mask[:,3:4, :, :] = warped_cm_onehot
-                    fake_segmap = fake_segmap * cloth_mask
-                    
-                if opt.clothmask_composition == 'warp_grad':
-                    cloth_mask = torch.ones_like(fake_segmap)
-                    cloth_mask[:,3:4, :, :] = warped_clothmask_paired
-                    fake_segmap = fake_segmap * cloth_mask
-                    
-            # make generator input parse map
-            fake_parse_gauss = gauss(F.interpolate(fake_segmap, size=(opt.fine_height, opt.fine_width), mode='bilinear'))
-            fake_parse = fake_parse_gauss.argmax(dim=1)[:, None]
-
-            if opt.cuda :
-                old_parse = torch.FloatTensor(fake_parse.size(0), 13, opt.fine_height, opt.fine_width).zero_().cuda()
-            else:
-                old_parse = torch.FloatTensor(fake_parse.size(0), 13, opt.fine_height, opt.fine_width).zero_()
-            old_parse.scatter_(1, fake_parse, 1.0)
-
-            labels = {
-                0:  ['background',  [0]],
-                1:  ['paste',       [2, 4, 7, 8, 9, 10, 11]],
-                2:  ['upper',       [3]],
-                3:  ['hair',        [1]],
-                4:  ['left_arm',    [5]],
-                5:  ['right_arm',   [6]],
-                6:  ['noise',       [12]]
-            }
-            if opt.cuda :
-                parse = torch.FloatTensor(fake_parse.size(0), 7, opt.fine_height, opt.fine_width).zero_().cuda()
-            else:
-                parse = torch.FloatTensor(fake_parse.size(0), 7, opt.fine_height, opt.fine_width).zero_()
-            for i in range(len(labels)):
-                for label in labels[i][1]:
-                    parse[:, i] += old_parse[:, label]
-                    
-            # warped cloth
-            N, _, iH, iW = clothes.shape
-            flow = F.interpolate(flow_list[-1].permute(0, 3, 1, 2), size=(iH, iW), mode='bilinear').permute(0, 2, 3, 1)
-            flow_norm = torch.cat([flow[:, :, :, 0:1] / ((96 - 1.0) / 2.0), flow[:, :, :, 1:2] / ((128 - 1.0) / 2.0)], 3)
-            
-            grid = make_grid(N, iH, iW,opt)
-            warped_grid = grid + flow_norm
-            warped_cloth = F.grid_sample(clothes, warped_grid, padding_mode='border')
-            warped_clothmask = F.grid_sample(pre_clothes_mask, warped_grid, padding_mode='border')
-            if opt.occlusion:
-                warped_clothmask = remove_overlap(F.softmax(fake_parse_gauss, dim=1), warped_clothmask)
-                warped_cloth = warped_cloth * warped_clothmask + torch.ones_like(warped_cloth) * (1-warped_clothmask)
-            
-
-            output = generator(torch.cat((agnostic, densepose, warped_cloth), dim=1), parse)
-            # visualize
-            unpaired_names = []
-            for i in range(shape[0]):
-                grid = make_image_grid([(clothes[i].cpu() / 2 + 0.5), (pre_clothes_mask[i].cpu()).expand(3, -1, -1), visualize_segmap(parse_agnostic.cpu(), batch=i), ((densepose.cpu()[i]+1)/2),
-                                        (warped_cloth[i].cpu().detach() / 2 + 0.5), (warped_clothmask[i].cpu().detach()).expand(3, -1, -1), visualize_segmap(fake_parse_gauss.cpu(), batch=i),
-                                        (pose_map[i].cpu()/2 +0.5), (warped_cloth[i].cpu()/2 + 0.5), (agnostic[i].cpu()/2 + 0.5),
-                                        (im[i]/2 +0.5), (output[i].cpu()/2 +0.5)],
-                                        nrow=4)
-                unpaired_name = (inputs['c_name']['paired'][i].split('.')[0] + '_' + inputs['c_name'][opt.datasetting][i].split('.')[0] + '.png')
-                save_image(grid, os.path.join(grid_dir, unpaired_name))
-                unpaired_names.append(unpaired_name)
-                
-            # save output
-            save_images(output, unpaired_names, output_dir)
-                
-            num += shape[0]
-            print(num)
-
-    print(f"Test time {time.time() - iter_start_time}")
-
-
-def main():
-    opt = get_opt()
-    print(opt)
-    print("Start to test %s!")
-    os.environ["CUDA_VISIBLE_DEVICES"] = opt.gpu_ids
-    
-    # create test dataset & loader
-    test_dataset = CPDatasetTest(opt)
-    test_loader = CPDataLoader(opt, test_dataset)
-    
-    # visualization
-    # if not os.path.exists(opt.tensorboard_dir):
-    #     os.makedirs(opt.tensorboard_dir)
-    # board = SummaryWriter(log_dir=os.path.join(opt.tensorboard_dir, opt.test_name, opt.datamode, opt.datasetting))
-
-    ## Model
-    # tocg
-    input1_nc = 4  # cloth + cloth-mask
-    input2_nc = opt.semantic_nc + 3  # parse_agnostic + densepose
-    tocg = ConditionGenerator(opt, input1_nc=input1_nc, input2_nc=input2_nc, output_nc=opt.output_nc, ngf=96, norm_layer=nn.BatchNorm2d)
-       
-    # generator
-    opt.semantic_nc = 7
-    generator = SPADEGenerator(opt, 3+3+3)
-    generator.print_network()
-       
-    # Load Checkpoint
-    load_checkpoint(tocg, opt.tocg_checkpoint,opt)
-    load_checkpoint_G(generator, opt.gen_checkpoint,opt)
-
-    # Train
-    test(opt, test_loader, tocg, generator)
-
-    print("Finished testing!")
-
-
-if __name__ == "__main__":
+import torch
+import torch.nn as nn
+
+from torchvision.utils import make_grid as make_image_grid
+from torchvision.utils import save_image
+import argparse
+import itertools
+import os
+import time
+from cp_dataset_test import CPDatasetTest, CPDataLoader
+from packed_dataset import PackedDataset
+
+from networks import ConditionGenerator, GaussianBlur, load_checkpoint
+from network_generator import SPADEGenerator
+from cpu_inference import optimize_for_cpu, compile_model, to_channels_last
+from quantization import autocast, to_float, prepare_int8, convert_int8
+from onnx_backend import load_onnx_models
+from tocg_postprocess import compose_clothmask, postprocess
+from output_writer import OUTPUT_FORMATS, OutputWriter
+from weight_files import init_device, load_into, generator_state_dict
+from tensorboardX import SummaryWriter
+from utils import *
+
+
+def get_opt(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--gpu_ids", default="")
+    parser.add_argument('-j', '--workers', type=int, default=4)
+    parser.add_argument('-b', '--batch-size', type=int, default=1)
+    parser.add_argument('--fp16', action='store_true', help='use amp')
+    # Cuda availability
+    parser.add_argument('--cuda',default=False, help='cuda or cpu')
+    # CPU inference
+    parser.add_argument('--cpu_fast', action='store_true', help='fuse conv + batch norm, bake spectral norms and use channels-last weights')
+    parser.add_argument('--num_threads', type=int, default=0, help='intra-op threads, 0 keeps the torch default')
+    parser.add_argument('--jit', choices=['none', 'trace', 'compile'], default='none', help='TorchScript-trace the generator or torch.compile both networks (with --cpu_fast)')
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'int8'], default='fp32', help='bf16 autocast or static int8 convs (CPU only)')
+    parser.add_argument('--calib_samples', type=int, default=8, help='batches used to calibrate int8 activation ranges')
+    parser.add_argument('--seg_pyramid', action='store_true', help='condition the SPADE norms on a label pyramid built once per batch, the norm convs only run at label boundaries')
+    parser.add_argument('--noise', choices=['random', 'fixed', 'off'], default='random', help='SPADE noise: drawn per call, seeded buffers reused per resolution (reproducible) or none')
+    parser.add_argument('--noise_seed', type=int, default=0, help='seed of the --noise fixed buffers')
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch', help='run the networks in PyTorch or in ONNX Runtime')
+    parser.add_argument('--onnx_dir', type=str, default='./onnx', help='graphs written by onnx_export.py (--backend onnx)')
+
+    parser.add_argument('--test_name', type=str, default='test', help='test name')
+    parser.add_argument("--dataroot", default="./data/zalando-hd-resize")
+    parser.add_argument("--datamode", default="test")
+    parser.add_argument("--data_list", default="test_pairs.txt")
+    parser.add_argument("--packed_dir", type=str, default=None, help="packed store built by packed_dataset.py, replaces dataroot")
+    parser.add_argument("--output_dir", type=str, default="./Output")
+    parser.add_argument("--output_format", choices=sorted(OUTPUT_FORMATS), default='jpg', help='try-on output encoding, npy keeps the raw float tensor')
+    parser.add_argument("--no_grid", action='store_true', help='skip the visualization grids')
+    parser.add_argument("--writer_workers", type=int, default=2, help='threads encoding and writing the outputs')
+    parser.add_argument("--writer_queue", type=int, default=16, help='pending writes before inference waits for the writers')
+    parser.add_argument("--datasetting", default="unpaired")
+    parser.add_argument("--fine_width", type=int, default=768)
+    parser.add_argument("--fine_height", type=int, default=1024)
+
+    parser.add_argument('--tensorboard_dir', type=str, default='./data/zalando-hd-resize/tensorboard', help='save tensorboard infos')
+    parser.add_argument('--checkpoint_dir', type=str, default='checkpoints', help='save checkpoint infos')
+    parser.add_argument('--tocg_checkpoint', type=str, default='./eval_models/weights/v0.1/mtviton.pth', help='tocg checkpoint')
+    parser.add_argument('--gen_checkpoint', type=str, default='./eval_models/weights/v0.1/gen.pth', help='G checkpoint')
+
+    parser.add_argument("--tensorboard_count", type=int, default=100)
+    parser.add_argument("--shuffle", action='store_true', help='shuffle input data')
+    parser.add_argument("--semantic_nc", type=int, default=13)
+    parser.add_argument("--output_nc", type=int, default=13)
+    parser.add_argument('--gen_semantic_nc', type=int, default=7, help='# of input label classes without unknown class')
+    
+    # network
+    parser.add_argument("--warp_feature", choices=['encoder', 'T1'], default="T1")
+    parser.add_argument("--out_layer", choices=['relu', 'conv'], default="relu")
+    
+    # training
+    parser.add_argument("--clothmask_composition", type=str, choices=['no_composition', 'detach', 'warp_grad'], default='warp_grad')
+        
+    # Hyper-parameters
+    parser.add_argument('--upsample', type=str, default='bilinear', choices=['nearest', 'bilinear'])
+    parser.add_argument('--occlusion', action='store_true', help="Occlusion handling")
+
+    # generator
+    parser.add_argument('--norm_G', type=str, default='spectralaliasinstance', help='instance normalization or batch normalization')
+    parser.add_argument('--ngf', type=int, default=64, help='# of gen filters in first conv layer')
+    parser.add_argument('--init_type', type=str, default='xavier', help='network initialization [normal|xavier|kaiming|orthogonal]')
+    parser.add_argument('--init_variance', type=float, default=0.02, help='variance of the initialization distribution')
+    parser.add_argument('--num_upsampling_layers', choices=('normal', 'more', 'most'), default='most', # normal: 256, more: 512
+                        help="If 'more', adds upsampling layer between the two middle resnet blocks. If 'most', also add one more upsampling + resnet layer at the end of the generator")
+
+    opt = parser.parse_args(args)
+    # Ensure opt.cuda is a boolean
+    opt.cuda = (opt.cuda == True or str(opt.cuda).lower() == 'true')
+    return opt
+
+def load_checkpoint_G(model, checkpoint_path,opt):
+    if not os.path.exists(checkpoint_path):
+        print("Invalid path!")
+        return
+    # training checkpoints are renamed on load, weight_files.py writes them renamed once
+    load_into(model, checkpoint_path, strict=True, rename=generator_state_dict)
+    if opt.cuda :
+        model.cuda()
+
+
+
+def make_input1(clothes, pre_clothes_mask):
+    # garment-side condition generator input at 256x192
+    clothes_down = F.interpolate(clothes, size=(256, 192), mode='bilinear')
+    pre_clothes_mask_down = F.interpolate(pre_clothes_mask, size=(256, 192), mode='nearest')
+    return torch.cat([clothes_down, pre_clothes_mask_down], 1)
+
+
+def make_input2(parse_agnostic, densepose):
+    # person-side condition generator input at 256x192
+    parse_agnostic_down = F.interpolate(parse_agnostic, size=(256, 192), mode='nearest')
+    densepose_down = F.interpolate(densepose, size=(256, 192), mode='bilinear')
+    return torch.cat([parse_agnostic_down, densepose_down], 1)
+
+
+def run_tryon(opt, inputs, tocg, generator, gauss, size=None, keep_segmap=True):
+    """
+        Runs the condition generator and the SPADE generator on one collated batch
+        and returns the try-on output together with the intermediate tensors.
+        Precomputed garment ('input1', 'E1_list') and person ('input2', 'E2_list')
+        features are used when present. `size` is the (H, W) output resolution,
+        see run_generator.
+    """
+    return run_generator(opt, run_condition(opt, inputs, tocg), generator, gauss, size, keep_segmap)
+
+
+def run_condition(opt, inputs, tocg):
+    """
+        First stage of run_tryon: moves the batch to the device and runs the
+        condition generator at 256x192. The result does not depend on the output
+        resolution, so one condition serves every rung of a resolution ladder.
+    """
+    if opt.cuda :
+        pre_clothes_mask = inputs['cloth_mask'][opt.datasetting].cuda()
+        agnostic = inputs['agnostic'].cuda()
+        clothes = inputs['cloth'][opt.datasetting].cuda() # target cloth
+        densepose = inputs['densepose'].cuda()
+    else :
+        pre_clothes_mask = inputs['cloth_mask'][opt.datasetting]
+        agnostic = inputs['agnostic']
+        clothes = inputs['cloth'][opt.datasetting] # target cloth
+        densepose = inputs['densepose']
+    pre_clothes_mask = threshold_mask(pre_clothes_mask)
+
+    if 'input2' in inputs:
+        # person features precomputed by the caller
+        input2 = inputs['input2']
+        E2_list = inputs['E2_list']
+        if opt.cuda :
+            input2 = input2.cuda()
+            E2_list = [E2.cuda() for E2 in E2_list]
+    else:
+        parse_agnostic = inputs['parse_agnostic'].cuda() if opt.cuda else inputs['parse_agnostic']
+        input2 = make_input2(parse_agnostic, densepose)
+        E2_list = None
+
+    if 'input1' in inputs:
+        # garment features precomputed by the caller
+        input1 = inputs['input1']
+        E1_list = inputs['E1_list']
+        if opt.cuda :
+            input1 = input1.cuda()
+            E1_list = [E1.cuda() for E1 in E1_list]
+    else:
+        input1 = make_input1(clothes, pre_clothes_mask)
+        E1_list = None
+
+    if opt.cpu_fast:
+        input1, input2 = to_channels_last(input1), to_channels_last(input2)
+
+    # forward
+    with autocast(opt):
+        tocg_output = tocg(opt,input1, input2, E1_list=E1_list, E2_list=E2_list)
+    flow_list, fake_segmap, warped_cloth_paired, warped_clothmask_paired = to_float(tocg_output)
+    
+    fake_segmap = compose_clothmask(opt, fake_segmap, warped_clothmask_paired)
+
+    return {
+        'clothes': clothes,
+        'pre_clothes_mask': pre_clothes_mask,
+        'agnostic': agnostic,
+        'densepose': densepose,
+        'flow': flow_list[-1],
+        'fake_segmap': fake_segmap,
+        }
+
+
+def run_generator(opt, condition, generator, gauss, size=None, keep_segmap=True):
+    """
+        Second stage of run_tryon: builds the parse map and the warped cloth at
+        `size` (H, W), opt.fine_height x opt.fine_width by default, and runs the
+        SPADE generator. Lower rungs downsample the full-resolution inputs.
+        Without `keep_segmap` the result's 'fake_parse_gauss' is None (see
+        tocg_postprocess.postprocess).
+    """
+    clothes = condition['clothes']
+    pre_clothes_mask = condition['pre_clothes_mask']
+    agnostic = condition['agnostic']
+    densepose = condition['densepose']
+    fake_segmap = condition['fake_segmap']
+    fine_height, fine_width = size if size is not None else (opt.fine_height, opt.fine_width)
+    if (fine_height, fine_width) != tuple(clothes.shape[2:]):
+        clothes = F.interpolate(clothes, size=(fine_height, fine_width), mode='area')
+        pre_clothes_mask = F.interpolate(pre_clothes_mask, size=(fine_height, fine_width), mode='nearest')
+        agnostic = F.interpolate(agnostic, size=(fine_height, fine_width), mode='area')
+        densepose = F.interpolate(densepose, size=(fine_height, fine_width), mode='area')
+
+    post = postprocess(opt, fake_segmap, condition['flow'], clothes, pre_clothes_mask, gauss, keep_segmap)
+    parse, warped_cloth = post['parse'], post['warped_cloth']
+
+    gen_input = torch.cat((agnostic, densepose, warped_cloth), dim=1)
+    if opt.cpu_fast:
+        gen_input, parse = to_channels_last(gen_input), to_channels_last(parse)
+    with autocast(opt):
+        output = generator(gen_input, parse).float()
+
+    return {
+        'output': output,
+        'clothes': clothes,
+        'pre_clothes_mask': pre_clothes_mask,
+        'agnostic': agnostic,
+        'densepose': densepose,
+        'fake_parse_gauss': post['fake_parse_gauss'],
+        'warped_cloth': warped_cloth,
+        'warped_clothmask': post['warped_clothmask'],
+        }
+
+
+def output_name(im_name, c_name):
+    # file name stem of the try-on of person `im_name` in cloth `c_name`
+    return im_name.split('.')[0] + '_' + c_name.split('.')[0]
+
+
+def save_grid(tiles, output, path):
+    # 12-tile visualization of one sample, `tiles` are the batch-of-one host copies collected in test()
+    parse_agnostic, pose_map, im, clothes, pre_clothes_mask, densepose, agnostic, warped_cloth, warped_clothmask, fake_parse_gauss = tiles
+    grid = make_image_grid([(clothes[0] / 2 + 0.5), pre_clothes_mask[0].expand(3, -1, -1), visualize_segmap(parse_agnostic), ((densepose[0]+1)/2),
+                            (warped_cloth[0] / 2 + 0.5), warped_clothmask[0].expand(3, -1, -1), visualize_segmap(fake_parse_gauss),
+                            (pose_map[0]/2 +0.5), (warped_cloth[0]/2 + 0.5), (agnostic[0]/2 + 0.5),
+                            (im[0]/2 +0.5), (output/2 +0.5)],
+                            nrow=4)
+    save_image(grid, path)
+
+
+def test(opt, test_loader, tocg, generator):
+    gauss = GaussianBlur((15, 15), (3, 3))
+    if opt.cuda:
+        gauss = gauss.cuda()
+    
+    # Model
+    if opt.cuda :
+        tocg.cuda()
+    tocg.eval()
+    generator.eval()
+    
+    if opt.output_dir is not None:
+        output_dir = opt.output_dir
+    else:
+        output_dir = os.path.join('./output', opt.test_name,
+                            opt.datamode, opt.datasetting, 'generator', 'output')
+    grid_dir = os.path.join('./output', opt.test_name,
+                             opt.datamode, opt.datasetting, 'generator', 'grid')
+    
+    if not opt.no_grid:
+        os.makedirs(grid_dir, exist_ok=True)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    num = 0
+    iter_start_time = time.time()
+    with OutputWriter(opt.writer_workers, opt.writer_queue) as writer, torch.inference_mode():
+        for inputs in test_loader.data_loader:
+            result = run_tryon(opt, inputs, tocg, generator, gauss, keep_segmap=not opt.no_grid)
+            output = result['output'].cpu()
+            if not opt.no_grid:
+                # the grid tiles are copied to the host here and assembled on the writer threads
+                tiles = [inputs['parse_agnostic'], inputs['pose'], inputs['image']]
+                tiles += [result[key].cpu() for key in ['clothes', 'pre_clothes_mask', 'densepose', 'agnostic',
+                                                        'warped_cloth', 'warped_clothmask', 'fake_parse_gauss']]
+            for i in range(output.shape[0]):
+                unpaired_name = output_name(inputs['c_name']['paired'][i], inputs['c_name'][opt.datasetting][i])
+                if not opt.no_grid:
+                    writer.submit(save_grid, [tile[i:i + 1] for tile in tiles], output[i], os.path.join(grid_dir, unpaired_name + '.png'))
+                writer.save(output[i], os.path.join(output_dir, unpaired_name), opt.output_format)
+
+            num += output.shape[0]
+            print(num)
+
+    print(f"Test time {time.time() - iter_start_time}")
+
+
+def build_models(opt, calib_batches=None):
+    if opt.backend == 'onnx':
+        assert opt.precision == 'fp32', "the ONNX graphs are exported in fp32"
+        assert opt.noise != 'fixed', "the ONNX generator graph is exported with --noise random or off"
+        opt.semantic_nc = 7
+        if opt.num_threads > 0:
+            torch.set_num_threads(opt.num_threads)
+        tocg, generator = load_onnx_models(opt)
+        # the SPADE noise is part of the generator graph, so opt (and the cache keys) record the exported mode
+        if opt.noise != generator.noise:
+            print("the ONNX generator was exported with --noise %s, running with it" % generator.noise)
+            opt.noise = generator.noise
+        return tocg, generator
+
+    with init_device(opt.tocg_checkpoint, opt.gen_checkpoint):
+        # tocg
+        input1_nc = 4  # cloth + cloth-mask
+        input2_nc = opt.semantic_nc + 3  # parse_agnostic + densepose
+        tocg = ConditionGenerator(opt, input1_nc=input1_nc, input2_nc=input2_nc, output_nc=opt.output_nc, ngf=96, norm_layer=nn.BatchNorm2d)
+
+        # generator
+        opt.semantic_nc = 7
+        generator = SPADEGenerator(opt, 3+3+3)
+    generator.print_network()
+       
+    # Load Checkpoint
+    load_checkpoint(tocg, opt.tocg_checkpoint,opt)
+    load_checkpoint_G(generator, opt.gen_checkpoint,opt)
+    return prepare_inference(opt, tocg, generator, calib_batches)
+
+
+def quantize_models(opt, tocg, generator, calib_batches):
+    # static int8: observe activation ranges on a few real batches, then swap in the quantized convs
+    prepare_int8(tocg)
+    prepare_int8(generator)
+    gauss = GaussianBlur((15, 15), (3, 3))
+    with torch.no_grad():
+        for inputs in calib_batches:
+            run_tryon(opt, inputs, tocg, generator, gauss)
+    convert_int8(tocg)
+    convert_int8(generator)
+
+
+def prepare_inference(opt, tocg, generator, calib_batches=None):
+    # CPU inference mode and reduced precision, a no-op with the default options
+    if opt.num_threads > 0:
+        torch.set_num_threads(opt.num_threads)
+    if opt.precision == 'int8':
+        assert calib_batches is not None, "int8 inference needs calibration batches"
+        quantize_models(opt, tocg, generator, calib_batches)
+    generator.set_noise(opt.noise, opt.noise_seed)
+    # eager forwards only, traced and compiled graphs keep the dense convs
+    generator.seg_pyramid = opt.seg_pyramid
+    if not opt.cpu_fast:
+        return tocg, generator
+
+    if opt.precision != 'int8':
+        optimize_for_cpu(tocg)
+        optimize_for_cpu(generator)
+    if opt.jit == 'trace':
+        assert opt.noise != 'fixed', "a traced generator keeps the noise buffers of the traced size, use --noise off"
+        # the condition generator takes `opt` and optional pyramids, so only the generator is traced
+        device = 'cuda' if opt.cuda else 'cpu'
+        x = torch.zeros(1, 9, opt.fine_height, opt.fine_width, device=device)
+        seg = torch.zeros(1, opt.gen_semantic_nc, opt.fine_height, opt.fine_width, device=device)
+        with autocast(opt):
+            generator = compile_model(generator, 'trace', (to_channels_last(x), to_channels_last(seg)))
+    elif opt.jit == 'compile':
+        tocg = compile_model(tocg, 'compile')
+        generator = compile_model(generator, 'compile')
+    return tocg, generator
+
+
+def main():
+    opt = get_opt()
+    print(opt)
+    print("Start to test %s!")
+    os.environ["CUDA_VISIBLE_DEVICES"] = opt.gpu_ids
+    
+    # create test dataset & loader
+    if opt.packed_dir is not None:
+        test_dataset = PackedDataset(opt)
+    else:
+        test_dataset = CPDatasetTest(opt)
+    test_loader = CPDataLoader(opt, test_dataset)
+    
+    # visualization
+    # if not os.path.exists(opt.tensorboard_dir):
+    #     os.makedirs(opt.tensorboard_dir)
+    # board = SummaryWriter(log_dir=os.path.join(opt.tensorboard_dir, opt.test_name, opt.datamode, opt.datasetting))
+
+    ## Model
+    calib_batches = None
+    if opt.precision == 'int8':
+        calib_batches = list(itertools.islice(test_loader.data_loader, opt.calib_samples))
+    tocg, generator = build_models(opt, calib_batches)
+
+    # Train
+    test(opt, test_loader, tocg, generator)
+
+    print("Finished testing!")
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
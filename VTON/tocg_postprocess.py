@@ -0,0 +1,105 @@
+import torch
+import torch.nn.functional as F
+
+from networks import make_grid
+from parse_labels import gen_labels
+from utils import threshold_mask, onehot_parse
+
+
+PARSE_BAND = 128  # output rows per band when the blurred segmentation map is not kept
+gen_label_lut = {}
+
+
+def remove_overlap(seg_out, warped_cm):
+
+    assert len(warped_cm.shape) == 4
+
+    warped_cm = warped_cm - (torch.cat([seg_out[:, 1:3, :, :], seg_out[:, 5:, :, :]], dim=1)).sum(dim=1, keepdim=True) * warped_cm
+    return warped_cm
+
+
+def compose_clothmask(opt, fake_segmap, warped_clothmask):
+    # multiplies the cloth channel of the condition generator logits by its warped cloth mask (opt.clothmask_composition)
+    if opt.clothmask_composition == 'no_composition':
+        return fake_segmap
+    if opt.clothmask_composition == 'detach':
+        warped_clothmask = threshold_mask(warped_clothmask)
+    cloth_mask = torch.ones_like(fake_segmap)
+    cloth_mask[:, 3:4, :, :] = warped_clothmask
+    return fake_segmap * cloth_mask
+
+
+def argmax_labels(x):
+    # x.argmax(dim=1)[:, None] as a running max over the channels, several times faster on NCHW maps
+    best = x[:, 0:1]
+    labels = torch.zeros_like(best, dtype=torch.long)
+    for c in range(1, x.size(1)):
+        better = x[:, c:c + 1] > best
+        best = torch.where(better, x[:, c:c + 1], best)
+        labels.masked_fill_(better, c)
+    return labels
+
+
+def generator_parse(labels):
+    # (N, 1, H, W) 13-class labels -> (N, 7, H, W) one-hot generator parse through a label LUT (parse_labels.gen_labels)
+    lut = gen_label_lut.get(labels.device)
+    if lut is None:
+        groups = {label: i for i, (_, group) in gen_labels.items() for label in group}
+        with torch.inference_mode(False):
+            lut = torch.tensor([groups[label] for label in range(len(groups))], device=labels.device)
+        gen_label_lut[labels.device] = lut
+    return onehot_parse(lut[labels], len(gen_labels))
+
+
+def segmap_labels(fake_segmap, size, gauss, band=PARSE_BAND):
+    # argmax labels of the resized, blurred logits, one band of rows at a time
+    labels = [argmax_labels(gauss.resize(fake_segmap, size, rows=slice(row, row + band)))
+              for row in range(0, size[0], band)]
+    return torch.cat(labels, dim=2)
+
+
+def warp_cloth(opt, flow, clothes, clothes_mask):
+    # warps the cloth and its mask with the (N, h, w, 2) flow of the condition generator, upsampled to the cloth size
+    N, _, iH, iW = clothes.shape
+    flow = F.interpolate(flow.permute(0, 3, 1, 2), size=(iH, iW), mode='bilinear').permute(0, 2, 3, 1)
+    flow_norm = flow / flow.new_tensor([(96 - 1.0) / 2.0, (128 - 1.0) / 2.0])
+    warped_grid = make_grid(N, iH, iW, opt) + flow_norm
+    warped_cloth = F.grid_sample(clothes, warped_grid, padding_mode='border')
+    warped_clothmask = F.grid_sample(clothes_mask, warped_grid, padding_mode='border')
+    return warped_cloth, warped_clothmask
+
+
+def postprocess(opt, fake_segmap, flow, clothes, clothes_mask, gauss, keep_segmap=True):
+    """
+        Everything between the condition generator and the SPADE generator, at
+        the resolution of `clothes`: the 7-class generator parse and the warped
+        cloth / cloth mask, with the occlusion handling of opt.occlusion.
+        `fake_segmap` are the (composed, see compose_clothmask) 256x192 logits.
+
+        The bilinear upsampling and the Gaussian blur run as two matrix products
+        (GaussianBlur.resize) and the 13-class labels are mapped straight to the
+        7-class one-hot parse. Unless `keep_segmap` is set or the occlusion
+        handling needs it, the full-resolution 13-channel map is never built:
+        the labels are computed in bands of PARSE_BAND rows and
+        'fake_parse_gauss' is None.
+    """
+    size = tuple(clothes.shape[2:])
+    fake_parse_gauss = None
+    if keep_segmap or opt.occlusion:
+        fake_parse_gauss = gauss.resize(fake_segmap, size)
+        labels = argmax_labels(fake_parse_gauss)
+    else:
+        labels = segmap_labels(fake_segmap, size, gauss)
+    parse = generator_parse(labels)
+
+    warped_cloth, warped_clothmask = warp_cloth(opt, flow, clothes, clothes_mask)
+    if opt.occlusion:
+        warped_clothmask = remove_overlap(F.softmax(fake_parse_gauss, dim=1), warped_clothmask)
+        warped_cloth = warped_cloth * warped_clothmask + (1 - warped_clothmask)
+
+    return {
+        'parse': parse,
+        'fake_parse_gauss': fake_parse_gauss,
+        'warped_cloth': warped_cloth,
+        'warped_clothmask': warped_clothmask,
+        }
@@ -0,0 +1,125 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import os.path as osp
+from collections import OrderedDict
+
+import torch
+
+
+WEIGHTS_FORMAT = 'hr-viton-weights-1'
+WEIGHTS_EXTENSIONS = {'safetensors': '.safetensors', 'pt': '.weights.pt'}
+
+
+def generator_state_dict(state_dict):
+    # SPADEGenerator keys of the released checkpoints ('ace' norms, '.Spade' submodules) renamed to this code's
+    new_state_dict = OrderedDict([(k.replace('ace', 'alias').replace('.Spade', ''), v) for (k, v) in state_dict.items()])
+    new_state_dict._metadata = OrderedDict([(k.replace('ace', 'alias').replace('.Spade', ''), v) for (k, v) in state_dict._metadata.items()])
+    return new_state_dict
+
+
+def save_weights(state_dict, path):
+    """
+        Writes a state dict as an inference weight file: safetensors for a
+        .safetensors path, a torch zip archive otherwise. The module versions of
+        state_dict._metadata, which the spectral norm load hooks read, are kept as
+        JSON in the file metadata.
+    """
+    metadata = {'format': WEIGHTS_FORMAT, '_metadata': json.dumps(getattr(state_dict, '_metadata', {}))}
+    if path.endswith('.safetensors'):
+        from safetensors.torch import save_file
+
+        # safetensors refuses tensors sharing storage
+        save_file({k: v.contiguous().clone() for k, v in state_dict.items()}, path, metadata=metadata)
+    else:
+        torch.save({'metadata': metadata, 'state_dict': dict(state_dict)}, path)
+
+
+def load_weights(path):
+    """
+        Returns (state_dict, converted). Weight files written by save_weights are
+        memory-mapped, so loading costs no reads up front and processes loading
+        the same file share its pages; `converted` is then True and the keys
+        need no renaming. Training checkpoints load as a plain torch.load.
+    """
+    if path.endswith('.safetensors'):
+        from safetensors import safe_open
+
+        with safe_open(path, framework='pt') as f:
+            metadata = f.metadata()
+            state_dict = OrderedDict((key, f.get_tensor(key)) for key in f.keys())
+    else:
+        try:
+            checkpoint = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+        except Exception:
+            # legacy (non-zip) checkpoints cannot be memory-mapped
+            return torch.load(path), False
+        if not (isinstance(checkpoint, dict) and checkpoint.get('metadata', {}).get('format') == WEIGHTS_FORMAT):
+            return checkpoint, False
+        metadata = checkpoint['metadata']
+        state_dict = OrderedDict(checkpoint['state_dict'])
+    state_dict._metadata = OrderedDict(json.loads(metadata['_metadata']))
+    return state_dict, True
+
+
+def is_weight_file(path):
+    # judged by name, see WEIGHTS_EXTENSIONS
+    return path.endswith(tuple(WEIGHTS_EXTENSIONS.values()))
+
+
+def init_device(*paths):
+    """
+        Context to build networks in: weight files hold every tensor, so when all
+        `paths` are weight files the networks are built on the meta device and
+        the random initialization of their parameters is skipped.
+    """
+    if all(osp.exists(path) and is_weight_file(path) for path in paths):
+        return torch.device('meta')
+    return contextlib.nullcontext()
+
+
+def load_into(model, path, strict=True, rename=None):
+    """
+        Loads a checkpoint or a weight file into `model`. Training checkpoints go
+        through `rename` first; memory-mapped weights are assigned to the model
+        instead of copied, so its parameters stay shared with the file.
+    """
+    state_dict, converted = load_weights(path)
+    if not converted and rename is not None:
+        state_dict = rename(state_dict)
+    log = model.load_state_dict(state_dict, strict=strict, assign=converted)
+    missing = [name for name, t in itertools.chain(model.named_parameters(), model.named_buffers()) if t.is_meta]
+    if missing:
+        raise ValueError("%s does not hold %s" % (path, ', '.join(missing)))
+    return log
+
+
+def convert_weights(tocg_checkpoint, gen_checkpoint, output_dir, weights_format='safetensors'):
+    # writes <checkpoint name><extension> for both networks into output_dir, returns the paths
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for checkpoint, rename in [(tocg_checkpoint, None), (gen_checkpoint, generator_state_dict)]:
+        state_dict = torch.load(checkpoint, map_location='cpu')
+        if rename is not None:
+            state_dict = rename(state_dict)
+        path = osp.join(output_dir, osp.splitext(osp.basename(checkpoint))[0] + WEIGHTS_EXTENSIONS[weights_format])
+        save_weights(state_dict, path)
+        print("%s -> %s (%.1f MB)" % (checkpoint, path, osp.getsize(path) / 2**20))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    # one-time conversion, then pass the written files as --tocg_checkpoint / --gen_checkpoint, e.g.
+    #     python weight_files.py --tocg_checkpoint ./eval_models/weights/v0.1/mtviton.pth \
+    #         --gen_checkpoint ./eval_models/weights/v0.1/gen.pth --output_dir ./eval_models/weights/v0.1
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tocg_checkpoint', type=str, default='./eval_models/weights/v0.1/mtviton.pth', help='tocg checkpoint')
+    parser.add_argument('--gen_checkpoint', type=str, default='./eval_models/weights/v0.1/gen.pth', help='G checkpoint')
+    parser.add_argument('--output_dir', type=str, default='./eval_models/weights/v0.1')
+    parser.add_argument('--format', choices=sorted(WEIGHTS_EXTENSIONS), default='safetensors', help='safetensors, or a torch archive when safetensors is not installed')
+
+    args = parser.parse_args()
+    convert_weights(args.tocg_checkpoint, args.gen_checkpoint, args.output_dir, args.format)